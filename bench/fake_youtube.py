@@ -0,0 +1,323 @@
+"""Finto YouTube locale per i benchmark: Data API, pagine video, audio e thumbnail
+
+Il server risponde come la Data API v3 (playlistItems, videos, playlists) e serve lo stesso
+campione audio e la stessa thumbnail per tutti i video, con latenza e banda configurabili.
+`BenchYoutubeDL` registra un estrattore che risolve i link youtube.com/watch verso questo
+server, così l'intera pipeline gira senza rete e con tempi ripetibili.
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import yt_dlp
+from PIL import Image
+from yt_dlp.extractor.common import InfoExtractor
+
+PAGE_SIZE = 50  # Massimo consentito dalla Data API per playlistItems e videos
+CHUNK_SIZE = 64 * 1024
+
+
+def bench_playlist_id(size: int) -> str:
+    """ID della playlist finta con `size` video"""
+    return f'PLbench{size}'
+
+
+def bench_video_id(index: int) -> str:
+    """ID (11 caratteri, come quelli veri) del video in posizione `index`"""
+    return f'b{index:010d}'
+
+
+def make_audio_sample(ffmpeg: str, duration: float) -> bytes:
+    """Campione m4a (AAC) con il moov in testa, generato da ffmpeg"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sample.m4a')
+        subprocess.run(
+            [ffmpeg, '-v', 'error', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+             '-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', '-y', path],
+            check=True,
+        )
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+def make_thumbnail(size: Tuple[int, int] = (1280, 720)) -> bytes:
+    """Thumbnail JPEG delle dimensioni di una maxresdefault"""
+    image = Image.radial_gradient('L').resize(size).convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class FakeYoutube:
+    """Server HTTP locale che imita la Data API e i server dei contenuti
+
+    `playlists` associa l'ID di ogni playlist al numero di video. `api_latency` e
+    `media_latency` sono i secondi di attesa prima di ogni risposta; `bandwidth` (byte/s)
+    limita ogni connessione che scarica audio o thumbnail. Con `distinct_titles` i titoli si
+    ripetono ogni N video (video diversi con lo stesso nome di file).
+    """
+
+    def __init__(self, playlists: Dict[str, int], audio: bytes, thumbnail: bytes, duration: int = 3,
+                 api_latency: float = 0.0, media_latency: float = 0.0, bandwidth: Optional[float] = None,
+                 host: str = '127.0.0.1', port: int = 0, distinct_titles: Optional[int] = None):
+        self.playlists = playlists
+        self.distinct_titles = distinct_titles
+        self.audio = audio
+        self.thumbnail = thumbnail
+        self.duration = duration
+        self.api_latency = api_latency
+        self.media_latency = media_latency
+        self.bandwidth = bandwidth
+        self.requests: Dict[str, int] = {}  # Richieste servite per endpoint
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> str:
+        """Avvia il server in un thread e restituisce l'URL base"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-youtube', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def video(self, video_id: str) -> dict:
+        """Risorsa `videos` della Data API per un video finto"""
+        index = int(video_id[1:])
+        return {
+            'kind': 'youtube#video',
+            'id': video_id,
+            'snippet': {
+                'title': f'Bench Track {index % self.distinct_titles if self.distinct_titles else index:05d}',
+                'channelTitle': 'Bench Artist',
+                'publishedAt': '2024-01-01T00:00:00Z',
+                'description': 'Traccia generata per il benchmark',
+                'thumbnails': {
+                    'high': {'url': f'{self.url}/thumb/{video_id}.jpg', 'width': 480, 'height': 360},
+                    'maxres': {'url': f'{self.url}/thumb/{video_id}.jpg', 'width': 1280, 'height': 720},
+                },
+            },
+            'contentDetails': {'duration': f'PT{self.duration}S'},
+            'status': {'privacyStatus': 'public', 'uploadStatus': 'processed'},
+        }
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, come i client veri
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                path = parsed.path
+                try:
+                    if path.startswith('/youtube/v3/'):
+                        time.sleep(fake.api_latency)
+                        self.api(path.rsplit('/', 1)[-1], query)
+                    elif path.startswith('/watch/'):
+                        time.sleep(fake.media_latency)
+                        fake.count('watch')
+                        video_id = path.rsplit('/', 1)[-1]
+                        self.send_json({
+                            'id': video_id,
+                            'title': fake.video(video_id)['snippet']['title'],
+                            'uploader': 'Bench Artist',
+                            'duration': fake.duration,
+                            'media_url': f'{fake.url}/media/{video_id}.m4a',
+                            'thumbnail': f'{fake.url}/thumb/{video_id}.jpg',
+                            'filesize': len(fake.audio),
+                        })
+                    elif path.startswith('/media/'):
+                        fake.count('media')
+                        self.send_bytes(fake.audio, 'audio/mp4')
+                    elif path.startswith('/thumb/'):
+                        fake.count('thumbnail')
+                        self.send_bytes(fake.thumbnail, 'image/jpeg')
+                    else:
+                        self.send_json({'error': {'code': 404, 'message': 'Not Found'}}, 404)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Il client ha chiuso la connessione (es. download annullato)
+
+            def api(self, endpoint: str, query: dict):
+                fake.count(endpoint)
+                if endpoint == 'playlistItems':
+                    size = fake.playlists.get(query.get('playlistId'))
+                    if size is None:
+                        self.send_json({'error': {'code': 404, 'message': 'Playlist non trovata'}}, 404)
+                        return
+                    start = int(query.get('pageToken') or 0)
+                    count = min(int(query.get('maxResults') or 5), PAGE_SIZE)
+                    end = min(size, start + count)
+                    data = {
+                        'kind': 'youtube#playlistItemListResponse',
+                        'pageInfo': {'totalResults': size, 'resultsPerPage': count},
+                        'items': [{'snippet': {'position': index,
+                                               'resourceId': {'kind': 'youtube#video',
+                                                              'videoId': bench_video_id(index)}}}
+                                  for index in range(start, end)],
+                    }
+                    if end < size:
+                        data['nextPageToken'] = str(end)
+                    self.send_json(data)
+                elif endpoint == 'videos':
+                    ids = [vid for vid in (query.get('id') or '').split(',') if vid][:PAGE_SIZE]
+                    self.send_json({'kind': 'youtube#videoListResponse',
+                                    'items': [fake.video(vid) for vid in ids]})
+                elif endpoint == 'playlists':
+                    playlist_id = query.get('id')
+                    items = ([{'id': playlist_id, 'snippet': {'title': f'Bench {fake.playlists[playlist_id]}'}}]
+                             if playlist_id in fake.playlists else [])
+                    self.send_json({'kind': 'youtube#playlistListResponse', 'items': items})
+                else:
+                    self.send_json({'error': {'code': 404, 'message': 'Not Found'}}, 404)
+
+            def send_json(self, data: dict, status: int = 200):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_bytes(self, data: bytes, content_type: str):
+                """Risponde con `data` (anche parziale con Range), rispettando latenza e banda"""
+                time.sleep(fake.media_latency)
+                start, end = 0, len(data) - 1
+                match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(end, int(match.group(2))) if match.group(2) else end
+                    else:
+                        start = max(0, len(data) - int(match.group(2)))
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{len(data)}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+
+                began = time.monotonic()
+                sent = 0
+                for offset in range(start, end + 1, CHUNK_SIZE):
+                    chunk = data[offset:min(end + 1, offset + CHUNK_SIZE)]
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+                    if fake.bandwidth:
+                        # Ritmo costante: ogni connessione non supera `bandwidth` byte/s
+                        delay = sent / fake.bandwidth - (time.monotonic() - began)
+                        if delay > 0:
+                            time.sleep(delay)
+
+        return Handler
+
+
+class FakeYoutubeIE(InfoExtractor):
+    """Estrattore yt-dlp per i link youtube.com/watch, risolti sul server finto"""
+
+    IE_NAME = 'fakeyoutube'
+    _VALID_URL = r'https?://(?:www\.)?youtube\.com/watch\?v=(?P<id>[0-9A-Za-z_-]{11})'
+    server_url: Optional[str] = None  # URL base di FakeYoutube
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        data = self._download_json(f'{self.server_url}/watch/{video_id}', video_id)
+        return {
+            'id': video_id,
+            'title': data['title'],
+            'uploader': data['uploader'],
+            'duration': data['duration'],
+            'thumbnails': [{'url': data['thumbnail'], 'id': 'maxresdefault', 'width': 1280, 'height': 720}],
+            'formats': [{
+                'format_id': '140',
+                'url': data['media_url'],
+                'ext': 'm4a',
+                'acodec': 'mp4a.40.2',
+                'vcodec': 'none',
+                'abr': 128,
+                'asr': 44100,
+                'filesize': data['filesize'],
+                'protocol': 'https' if data['media_url'].startswith('https') else 'http',
+            }],
+        }
+
+
+class BenchYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL con il solo estrattore finto: nessuna richiesta esce dalla macchina"""
+
+    def __init__(self, params: Optional[dict] = None, auto_init: bool = True):
+        super().__init__(params, auto_init=False)
+        self.add_info_extractor(FakeYoutubeIE())
+
+
+def main():
+    """Avvia il server da solo, per provare l'elenco della CLI (`--list --api-base-url ...`)
+
+    Con `--api-base-url` la CLI manda qui solo le chiamate alla Data API: yt-dlp usa il vero
+    estrattore di YouTube, quindi un download scaricherebbe da youtube.com. Le run complete
+    senza rete passano da `run_bench.py` e `run_workers.py`, che registrano `FakeYoutubeIE`.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Finto YouTube locale per i benchmark')
+    parser.add_argument('sizes', nargs='*', type=int, default=[50], help='Numero di video di ogni playlist')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--duration', type=int, default=3, help='Durata del campione audio in secondi')
+    parser.add_argument('--api-latency', type=float, default=0.0)
+    parser.add_argument('--media-latency', type=float, default=0.0)
+    parser.add_argument('--bandwidth', type=float, default=None, help='Byte/s per connessione')
+    args = parser.parse_args()
+
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        sys.exit('ffmpeg non trovato nel PATH')
+    fake = FakeYoutube({bench_playlist_id(size): size for size in args.sizes},
+                       make_audio_sample(ffmpeg, args.duration), make_thumbnail(), duration=args.duration,
+                       api_latency=args.api_latency, media_latency=args.media_latency,
+                       bandwidth=args.bandwidth, port=args.port)
+    print(f'Data API: {fake.url}/youtube/v3 (solo elenco: i download della CLI userebbero youtube.com)')
+    for size in args.sizes:
+        print(f'Playlist: https://www.youtube.com/playlist?list={bench_playlist_id(size)}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Controllo del tempo di avvio per l'elenco delle playlist (--list)
+
+Misura in processi nuovi il tempo per importare `main` e creare il downloader, cioè tutto ciò
+che serve all'elenco, e gli sottrae il solo import di `requests`, l'unica dipendenza caricata
+all'avvio (client HTTP dell'elenco). Quello che resta è il costo proprio di `main`: moduli
+della libreria standard, definizioni e costruzione del downloader. Fallisce (codice 1) se
+yt-dlp, Pillow, mutagen o httpx vengono caricati all'avvio o se quel costo supera
+`--max-overhead` millisecondi, così anche un modulo di medie dimensioni importato per errore
+viene notato.
+
+Esempio:
+    python bench/import_budget.py
+    python bench/import_budget.py --runs 9 --max-overhead 20
+"""
+
+import argparse
+import compileall
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+HEAVY_MODULES = ('yt_dlp', 'PIL', 'mutagen', 'httpx')
+
+# Avvio dell'elenco: import e costruzione del downloader, senza rete né file di stato
+LISTING_STARTUP = """
+import time
+started = time.perf_counter()
+import main
+main.YouTubePlaylistDownloader('budget', cover_cache_dir=None, quota_file=None)
+"""
+REQUESTS_IMPORT = """
+import time
+started = time.perf_counter()
+import requests
+"""
+REPORT = """
+elapsed = time.perf_counter() - started
+import json, sys
+print(json.dumps({'seconds': elapsed, 'heavy': [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure(code: str, runs: int) -> dict:
+    """Mediana dei tempi su `runs` interpreti nuovi e moduli pesanti caricati"""
+    samples, heavy = [], set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code + REPORT], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result['seconds'])
+        heavy.update(result['heavy'])
+    return {'median': statistics.median(samples), 'min': min(samples), 'heavy': sorted(heavy)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Tempo di avvio dell'elenco playlist oltre l'import di requests")
+    parser.add_argument('--runs', type=int, default=5, help='Processi per misura (si usa la mediana)')
+    parser.add_argument('--max-overhead', type=float, default=30.0,
+                        help="Millisecondi massimi di avvio oltre l'import di requests (default: 30)")
+    args = parser.parse_args()
+
+    # Bytecode già compilato in entrambi i casi, anche con PYTHONDONTWRITEBYTECODE
+    compileall.compile_file(os.path.join(REPO_ROOT, 'main.py'), quiet=1)
+
+    listing = measure(LISTING_STARTUP, args.runs)
+    baseline = measure(REQUESTS_IMPORT, args.runs)
+    overhead = (listing['median'] - baseline['median']) * 1000
+
+    print(f"⏱️  Avvio elenco: {listing['median'] * 1000:.0f} ms (min {listing['min'] * 1000:.0f} ms)")
+    print(f"⏱️  Import requests: {baseline['median'] * 1000:.0f} ms (min {baseline['min'] * 1000:.0f} ms)")
+    print(f"📐 Costo proprio di main: {overhead:.0f} ms (budget {args.max_overhead:.0f} ms)")
+
+    failed = False
+    if listing['heavy']:
+        print(f"❌ Moduli pesanti caricati all'avvio: {', '.join(listing['heavy'])}")
+        failed = True
+    if overhead > args.max_overhead:
+        print('❌ Avvio oltre il budget')
+        failed = True
+    if not failed:
+        print('✅ Avvio entro il budget')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
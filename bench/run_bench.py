@@ -0,0 +1,295 @@
+"""Benchmark offline della pipeline completa contro il finto YouTube locale
+
+Per ogni dimensione di playlist avvia un processo separato che scarica, ricodifica e tagga
+tutti i video serviti da `fake_youtube`, poi riporta tracce al minuto, tempo al primo file,
+latenze p50/p95 di ogni stadio, picco di memoria e secondi di CPU. I risultati sono salvati
+in JSON insieme al commit, così due run su commit diversi si confrontano con `--compare`.
+
+Esempio:
+    python bench/run_bench.py --sizes 50 1000
+    python bench/run_bench.py --sizes 50 --compare bench/results/abc1234.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+try:
+    import resource  # Non disponibile su Windows
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+DEFAULT_SIZES = (50, 1000, 10000)
+UNLIMITED_RATE = 1e6  # Richieste/s: il rate limiter non interviene mai
+
+# Metriche confrontate con --compare: (chiave, etichetta, True se più alto è meglio)
+COMPARED_METRICS = (
+    ('tracks_per_min', 'tracce/min', True),
+    ('time_to_first_file', 'primo file (s)', False),
+    ('cpu_seconds', 'CPU (s)', False),
+    ('peak_rss_mb', 'RSS picco (MB)', False),
+)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentile nearest-rank (None senza campioni)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def git_info() -> dict:
+    """Commit corrente e presenza di modifiche non committate"""
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(status) if status is not None else None}
+
+
+def run_child(spec: dict):
+    """Processo figlio: una run completa della pipeline, misurata dall'interno"""
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, BENCH_DIR)
+    import main as app
+    from fake_youtube import BenchYoutubeDL, FakeYoutubeIE, bench_playlist_id
+
+    FakeYoutubeIE.server_url = spec['server']
+    rate_limits = None
+    if spec['rate_limits'] == 'off':
+        rate_limits = {name: (UNLIMITED_RATE, UNLIMITED_RATE) for name in app.RateLimiter.DEFAULT_BUDGETS}
+
+    with tempfile.TemporaryDirectory(prefix='ytbench-') as tmp:
+        downloader = app.YouTubePlaylistDownloader(
+            'bench', max_workers=spec['workers'], prefetch=spec['prefetch'],
+            transcode_workers=spec['transcode_workers'], cover_cache_dir=os.path.join(tmp, 'covers'),
+            quota_file=None, api_quota=10 ** 9, output_format=spec['format'],
+            stream_transcode=spec['stream'], bandwidth=spec['client_bandwidth'],
+            api_base_url=f"{spec['server']}/youtube/v3", ydl_class=BenchYoutubeDL, rate_limits=rate_limits,
+        )
+        playlist_id = bench_playlist_id(spec['size'])
+        started = time.monotonic()
+        total = downloader.get_playlist_size(playlist_id)
+        listing = time.monotonic() - started
+        results = downloader.download_audio(downloader.iter_playlist_videos(playlist_id),
+                                            os.path.join(tmp, 'output'), total=total, source=playlist_id)
+        wall = time.monotonic() - started
+
+    report = {'size': spec['size'], 'wall': wall, 'successful': 0, 'failed': spec['size']}
+    if results:
+        first = results.get('time_to_first_file')
+        report.update({
+            'successful': results['successful'],
+            'failed': len(results['failed']),
+            'tracks_per_min': results['successful'] / wall * 60 if wall else None,
+            'time_to_first_file': listing + first if first is not None else None,
+            'stages': {name: {'count': len(durations), 'p50': percentile(durations, 50),
+                              'p95': percentile(durations, 95)}
+                       for name, durations in results.get('stage_durations', {}).items()},
+        })
+
+    if resource:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        # ffmpeg conta solo per la CPU: su Linux il ru_maxrss dei figli eredita quello del
+        # processo al momento del fork, quindi non misura la memoria di ffmpeg
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss: byte su macOS, KiB su Linux
+        report.update({
+            'peak_rss_mb': own.ru_maxrss / scale,
+            'cpu_user': own.ru_utime + children.ru_utime,
+            'cpu_system': own.ru_stime + children.ru_stime,
+            'cpu_seconds': own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        })
+
+    with open(spec['result_file'], 'w', encoding='utf-8') as f:
+        json.dump(report, f)
+
+
+def run_size(size: int, server: str, args: argparse.Namespace, env: Dict[str, str]) -> dict:
+    """Esegue una dimensione in un processo nuovo (memoria e CPU misurate da zero)"""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        result_file = f.name
+    spec = {
+        'size': size, 'server': server, 'result_file': result_file, 'workers': args.workers,
+        'transcode_workers': args.transcode_workers, 'prefetch': args.prefetch, 'format': args.format,
+        'stream': args.stream, 'rate_limits': args.rate_limits, 'client_bandwidth': args.client_bandwidth,
+    }
+    log = open(args.log, 'a', encoding='utf-8') if args.log else subprocess.DEVNULL
+    try:
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', json.dumps(spec)],
+                                 stdout=log, stderr=subprocess.STDOUT if args.log else None, env=env)
+        if process.returncode != 0:
+            raise RuntimeError(f'run da {size} video terminata con codice {process.returncode}')
+        with open(result_file, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        if args.log:
+            log.close()
+        os.unlink(result_file)
+
+
+def byte_rate(value: str) -> float:
+    """Banda in byte/s, anche con suffisso (es. 2M)"""
+    from yt_dlp.utils import parse_bytes
+
+    rate = parse_bytes(value)
+    if not rate:
+        raise argparse.ArgumentTypeError(f'banda non valida: {value}')
+    return float(rate)
+
+
+def fmt(value, digits: int = 2) -> str:
+    return '-' if value is None else f'{value:.{digits}f}'
+
+
+def print_run(run: dict):
+    print(f"\n📊 {run['size']} video: {run['successful']} completati, {run['failed']} falliti "
+          f"in {fmt(run['wall'], 1)}s")
+    print(f"   tracce/min {fmt(run.get('tracks_per_min'), 1)} · primo file {fmt(run.get('time_to_first_file'))}s · "
+          f"CPU {fmt(run.get('cpu_seconds'), 1)}s · RSS picco {fmt(run.get('peak_rss_mb'), 1)} MB")
+    for name, stage in (run.get('stages') or {}).items():
+        print(f"   {name:<14} p50 {fmt(stage['p50'], 3)}s · p95 {fmt(stage['p95'], 3)}s · {stage['count']} job")
+    if run.get('requests'):
+        print('   richieste: ' + ', '.join(f'{name} {count}' for name, count in sorted(run['requests'].items())))
+    sys.stdout.flush()  # Un risultato alla volta anche se l'output va in un file
+
+
+def compare(current: dict, baseline: dict):
+    """Stampa le differenze rispetto a un file di risultati precedente"""
+    base_commit = (baseline.get('meta', {}).get('commit') or '?')[:10]
+    print(f"\n🔍 Confronto con {base_commit}")
+    if baseline.get('config') != current.get('config'):
+        print('   ⚠️  configurazione diversa: i numeri non sono direttamente confrontabili')
+    base_runs = {run['size']: run for run in baseline.get('runs', [])}
+    for run in current['runs']:
+        base = base_runs.get(run['size'])
+        if not base:
+            continue
+        parts = []
+        for key, label, higher_is_better in COMPARED_METRICS:
+            old, new = base.get(key), run.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            better = change >= 0 if higher_is_better else change <= 0
+            parts.append(f"{label} {fmt(old)} → {fmt(new)} ({change:+.1f}% {'✓' if better else '✗'})")
+        print(f"   {run['size']} video: " + ' · '.join(parts))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark offline della pipeline contro un finto YouTube locale')
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_SIZES),
+                        help='Dimensioni delle playlist da misurare (default: 50 1000 10000)')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='Download paralleli')
+    parser.add_argument('--transcode-workers', type=int, default=None, help='Transcodifiche parallele')
+    parser.add_argument('--prefetch', type=int, default=0, help='Video risolti in anticipo')
+    parser.add_argument('--format', choices=('mp3', 'native'), default='mp3', help='Formato di output')
+    parser.add_argument('--stream', action='store_true', help='Transcodifica in streaming')
+    parser.add_argument('--rate-limits', choices=('off', 'shipped'), default='off',
+                        help="'off' misura la pipeline, 'shipped' usa i budget del rate limiter predefiniti")
+    parser.add_argument('--duration', type=int, default=3, help='Durata del campione audio in secondi')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='Latenza della Data API in secondi')
+    parser.add_argument('--media-latency', type=float, default=0.0, help='Latenza di audio e thumbnail in secondi')
+    parser.add_argument('--server-bandwidth', type=byte_rate, default=None,
+                        help='Byte/s serviti per connessione (default: illimitati)')
+    parser.add_argument('--client-bandwidth', type=byte_rate, default=None,
+                        help='Banda totale del downloader in byte/s (come --bandwidth della CLI)')
+    parser.add_argument('--ffmpeg', help='Cartella o percorso di ffmpeg (default: dal PATH)')
+    parser.add_argument('-o', '--output', help='File JSON dei risultati (default: bench/results/<commit>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='Risultati precedenti con cui confrontarsi')
+    parser.add_argument('--log', help="File in cui salvare l'output della pipeline")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    if args.child:
+        run_child(json.loads(args.child))
+        return 0
+
+    sys.path.insert(0, BENCH_DIR)
+    from fake_youtube import FakeYoutube, bench_playlist_id, make_audio_sample, make_thumbnail
+    import yt_dlp
+
+    # ffmpeg deve essere lo stesso per il campione e per la pipeline dei figli
+    env = dict(os.environ)
+    if args.ffmpeg:
+        ffmpeg_dir = args.ffmpeg if os.path.isdir(args.ffmpeg) else os.path.dirname(args.ffmpeg)
+        env['PATH'] = ffmpeg_dir + os.pathsep + env.get('PATH', '')
+    ffmpeg = shutil.which('ffmpeg', path=env.get('PATH'))
+    if not ffmpeg:
+        print('❌ ffmpeg non trovato: usa --ffmpeg o aggiungilo al PATH')
+        return 2
+
+    fake = FakeYoutube({bench_playlist_id(size): size for size in args.sizes},
+                       make_audio_sample(ffmpeg, args.duration), make_thumbnail(), duration=args.duration,
+                       api_latency=args.api_latency, media_latency=args.media_latency,
+                       bandwidth=args.server_bandwidth)
+    server = fake.start()
+    config = {key: getattr(args, key) for key in ('workers', 'transcode_workers', 'prefetch', 'format', 'stream',
+                                                  'rate_limits', 'duration', 'api_latency', 'media_latency',
+                                                  'server_bandwidth', 'client_bandwidth')}
+    report = {
+        'meta': {
+            **git_info(),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'yt_dlp': yt_dlp.version.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': subprocess.run([ffmpeg, '-version'], capture_output=True, text=True).stdout.split('\n')[0],
+        },
+        'config': config,
+        'runs': [],
+    }
+
+    print(f"🧪 Benchmark offline su {server} ({', '.join(map(str, args.sizes))} video)")
+    try:
+        for size in args.sizes:
+            before = dict(fake.requests)
+            run = run_size(size, server, args, env)
+            run['requests'] = {name: count - before.get(name, 0) for name, count in fake.requests.items()
+                               if count - before.get(name, 0)}
+            report['runs'].append(run)
+            print_run(run)
+    except KeyboardInterrupt:
+        print('\n⛔ Benchmark interrotto')
+        return 130
+    finally:
+        fake.stop()
+
+    output = args.output
+    if not output:
+        commit = (report['meta']['commit'] or 'nocommit')[:10]
+        output = os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if report['meta']['dirty'] else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Risultati salvati in {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Prova della modalità worker: più processi sulla stessa coda contro il finto YouTube locale
+
+Avvia `fake_youtube`, poi `--workers` processi che eseguono ognuno un `QueueWorker` sulla
+stessa cartella di output (come `python main.py PLAYLIST --worker` su più macchine, ma con
+l'estrattore yt-dlp puntato sul server locale). Con `--kill-after` il primo worker viene
+terminato a metà lavoro, così i suoi video passano agli altri alla scadenza del lease. Alla
+fine verifica la coda e la cartella: ogni video completato una sola volta, un file distinto
+per video, nessun file parziale. Esce con codice 1 se qualcosa non torna.
+
+Esempio:
+    python bench/run_workers.py --size 60 --workers 3
+    python bench/run_workers.py --size 60 --workers 3 --distinct-titles 20 --kill-after 3 --lease 5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+UNLIMITED_RATE = 1e6  # Richieste/s: il rate limiter non interviene mai
+
+
+def run_child(spec: dict) -> int:
+    """Processo worker: elabora la coda condivisa finché non è esaurita"""
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, BENCH_DIR)
+    import main as app
+    from fake_youtube import BenchYoutubeDL, FakeYoutubeIE
+
+    FakeYoutubeIE.server_url = spec['server']
+    downloader = app.YouTubePlaylistDownloader(
+        'bench', max_workers=spec['threads'], cover_cache_dir=None, quota_file=None, api_quota=10 ** 9,
+        in_memory=True, api_base_url=f"{spec['server']}/youtube/v3", ydl_class=BenchYoutubeDL,
+        rate_limits={name: (UNLIMITED_RATE, UNLIMITED_RATE) for name in app.RateLimiter.DEFAULT_BUDGETS},
+    )
+    worker = app.QueueWorker(downloader, spec['output'], worker_id=spec['worker_id'], lease=spec['lease'])
+    return 1 if worker.run([spec['playlist']]) else 0
+
+
+def check_output(output: str, size: int) -> list:
+    """Problemi trovati nella coda e nella cartella di output (lista vuota se tutto torna)"""
+    conn = sqlite3.connect(os.path.join(output, '.work_queue.sqlite'))
+    try:
+        rows = conn.execute('SELECT video_id, status, filepath, error FROM items').fetchall()
+    finally:
+        conn.close()
+
+    problems = []
+    if len(rows) != size:
+        problems.append(f'{len(rows)} video in coda invece di {size}')
+    done = [row for row in rows if row[1] == 'done']
+    for video_id, status, _, error in rows:
+        if status != 'done':
+            problems.append(f'{video_id}: {status} ({error})')
+    paths = [filepath for _, _, filepath, _ in done]
+    if len(set(paths)) != len(paths):
+        problems.append(f'{len(paths) - len(set(paths))} file condivisi da video diversi (sovrascritti)')
+    problems.extend(f'file mancante: {path}' for path in paths if not path or not os.path.exists(path))
+
+    files = [name for name in os.listdir(output) if not name.startswith('.')]
+    partial = [name for name in files if name.endswith(('.part', '.ytdl', '.temp'))]
+    problems.extend(f'file parziale: {name}' for name in partial)
+    if len(files) - len(partial) != len(done):
+        problems.append(f'{len(files) - len(partial)} file nella cartella per {len(done)} video completati')
+    return problems
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Più worker sulla stessa coda contro il finto YouTube locale')
+    parser.add_argument('--size', type=int, default=60, help='Video della playlist')
+    parser.add_argument('-w', '--workers', type=int, default=3, help='Processi worker')
+    parser.add_argument('--threads', type=int, default=2, help='Download paralleli per worker')
+    parser.add_argument('--lease', type=float, default=30.0, help='Secondi di validità di un claim')
+    parser.add_argument('--distinct-titles', type=int, default=None,
+                        help='Titoli diversi (si ripetono ogni N video, per provare i nomi di file uguali)')
+    parser.add_argument('--kill-after', type=float, default=None,
+                        help='Secondi dopo cui terminare il primo worker (SIGKILL)')
+    parser.add_argument('--duration', type=int, default=3, help='Durata del campione audio in secondi')
+    parser.add_argument('--media-latency', type=float, default=0.0, help='Latenza di audio e thumbnail in secondi')
+    parser.add_argument('--ffmpeg', help='Cartella o percorso di ffmpeg (default: dal PATH)')
+    parser.add_argument('-o', '--output', help='Cartella condivisa (default: temporanea, eliminata alla fine)')
+    parser.add_argument('--log', help="File in cui salvare l'output dei worker")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    if args.child:
+        return run_child(json.loads(args.child))
+
+    sys.path.insert(0, BENCH_DIR)
+    from fake_youtube import FakeYoutube, bench_playlist_id, make_audio_sample, make_thumbnail
+
+    env = dict(os.environ)
+    if args.ffmpeg:
+        ffmpeg_dir = args.ffmpeg if os.path.isdir(args.ffmpeg) else os.path.dirname(args.ffmpeg)
+        env['PATH'] = ffmpeg_dir + os.pathsep + env.get('PATH', '')
+    ffmpeg = shutil.which('ffmpeg', path=env.get('PATH'))
+    if not ffmpeg:
+        print('❌ ffmpeg non trovato: usa --ffmpeg o aggiungilo al PATH')
+        return 2
+
+    fake = FakeYoutube({bench_playlist_id(args.size): args.size}, make_audio_sample(ffmpeg, args.duration),
+                       make_thumbnail(), duration=args.duration, media_latency=args.media_latency,
+                       distinct_titles=args.distinct_titles)
+    server = fake.start()
+    output = args.output or tempfile.mkdtemp(prefix='ytworkers-')
+    log = open(args.log, 'a', encoding='utf-8') if args.log else subprocess.DEVNULL
+    print(f"🧩 {args.workers} worker su {output} ({args.size} video, server {server})")
+
+    processes = []
+    started = time.monotonic()
+    try:
+        for n in range(args.workers):
+            spec = {'server': server, 'output': output, 'playlist': bench_playlist_id(args.size),
+                    'worker_id': f'bench-{n}', 'threads': args.threads, 'lease': args.lease}
+            processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', json.dumps(spec)],
+                                              stdout=log, stderr=subprocess.STDOUT if args.log else None, env=env))
+        if args.kill_after is not None:
+            time.sleep(args.kill_after)
+            processes[0].send_signal(signal.SIGKILL)
+            print(f"💥 Worker bench-0 terminato dopo {args.kill_after:g}s")
+        codes = [process.wait() for process in processes]
+        elapsed = time.monotonic() - started
+
+        problems = check_output(output, args.size)
+        print(f"⏱️  {elapsed:.1f}s · codici di uscita: {codes} · richieste media: {fake.requests.get('media', 0)}")
+        if problems:
+            for problem in problems[:20]:
+                print(f"❌ {problem}")
+            return 1
+        print(f"✅ {args.size} video completati una volta sola, ognuno nel proprio file")
+        return 0
+    except KeyboardInterrupt:
+        for process in processes:
+            process.kill()
+        print('\n⛔ Interrotto')
+        return 130
+    finally:
+        fake.stop()
+        if log is not subprocess.DEVNULL:
+            log.close()
+        if not args.output:
+            shutil.rmtree(output, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,39 @@
 import requests
 import re
-import yt_dlp
 import os
 import sys
 import time
-from typing import List, Optional
-from datetime import datetime
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, TDRC, APIC, TPE2
-import urllib.request
+import queue
+import threading
+import sqlite3
+import subprocess
+import tempfile
+import shutil
+import argparse
+import socket
+import contextlib
+import hashlib
+import heapq
+import itertools
+import json
+import random
+import functools
+import importlib.util
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from base64 import b64encode
 from io import BytesIO
-from PIL import Image
+
+# yt-dlp, Pillow e mutagen vengono importati solo dove servono: l'elenco delle playlist
+# (--list) usa soltanto il client HTTP e parte senza caricare gli estrattori di yt-dlp
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+    import yt_dlp
+    from mutagen.mp3 import MP3
 
 
 class Colors:
@@ -29,33 +52,1717 @@ class Colors:
 class ProgressBar:
     """Classe per gestire la barra di progresso"""
 
-    def __init__(self, total: int, width: int = 50):
-        self.total = total
+    def __init__(self, total: Optional[int], width: int = 50, min_interval: float = 0.0):
+        self.total = total  # None se il numero di video non è ancora noto
         self.width = width
         self.current = 0
+        self.min_interval = min_interval  # Secondi minimi tra due ridisegni (0 = a ogni aggiornamento)
+        self._drawn = 0.0
+        self._lock = threading.Lock()  # Aggiornata da più worker in parallelo
 
     def update(self, increment: int = 1):
         """Aggiorna la barra di progresso"""
-        self.current += increment
-        percent = (self.current / self.total) * 100
-        filled = int(self.width * self.current // self.total)
+        with self._lock:
+            self.current += increment
+            self._render()
+
+    def set_total(self, total: int):
+        """Imposta il totale definitivo (es. a fine caricamento della playlist)"""
+        with self._lock:
+            self.total = total
+            if self.current:
+                self._render()
+
+    def _render(self):
+        """Ridisegna la barra di progresso"""
+        now = time.monotonic()
+        finished = self.total and self.current >= self.total
+        if not finished and now - self._drawn < self.min_interval:
+            return  # Ridisegnata da poco: il prossimo aggiornamento la mostrerà
+        self._drawn = now
+
+        if not self.total:
+            # Totale ancora sconosciuto: mostra solo il conteggio
+            print(f'\r{Colors.OKCYAN}[{self.current}/?]{Colors.ENDC}', end='', flush=True)
+            return
+
+        total = max(self.total, self.current)
+        percent = (self.current / total) * 100
+        filled = int(self.width * self.current // total)
         bar = '█' * filled + '░' * (self.width - filled)
 
-        print(f'\r{Colors.OKCYAN}[{bar}] {percent:.1f}% ({self.current}/{self.total}){Colors.ENDC}', end='', flush=True)
+        print(f'\r{Colors.OKCYAN}[{bar}] {percent:.1f}% ({self.current}/{total}){Colors.ENDC}', end='', flush=True)
 
-        if self.current >= self.total:
+        if self.current >= total:
             print()  # Nuova riga quando completato
 
 
+class EventStream:
+    """Eventi strutturati della run: tempi degli stadi, byte trasferiti, retry ed esito dei video
+
+    Ogni evento è un dizionario con `event` e `ts`: viene scritto come riga JSON su `path` (se
+    indicato), aggregato nelle metriche in formato testo di Prometheus e passato ai listener,
+    come il renderer della console.
+    """
+
+    PREFIX = 'ytpd'
+    LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}  # (nome, etichette) → valore
+        self.timings: Dict[str, List[float]] = {}  # stadio → [conteggio, somma, bucket cumulativi...]
+        self._listeners: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def subscribe(self, listener: Callable[[dict], None]):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[dict], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def emit(self, event: str, **fields) -> dict:
+        """Registra un evento e lo passa ai listener"""
+        record = {'event': event, 'ts': round(time.time(), 3), **fields}
+        with self._lock:
+            self._count('events_total', event=event)
+            if event == 'stage':
+                self._observe(record)
+            elif event == 'retry':
+                self._count('retries_total', kind=str(fields.get('kind')))
+            elif event == 'video_failed':
+                self._count('failures_total', failure=str(fields.get('failure')))
+            if self._file:
+                # Una riga intera per evento, anche con più thread
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                self._file.flush()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(record)
+        return record
+
+    @contextlib.contextmanager
+    def timer(self, stage: str, **fields):
+        """Misura un'operazione ed emette un evento `stage` con durata ed esito
+
+        Il chiamante può aggiungere campi al dizionario restituito (es. `bytes` trasferiti).
+        """
+        span = dict(fields)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.emit('stage', stage=stage, duration=round(time.perf_counter() - started, 6),
+                      ok='error' not in span, **span)
+
+    def _count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, record: dict):
+        """Aggiorna istogramma, errori e byte dello stadio"""
+        stage = str(record['stage'])
+        duration = record['duration']
+        timing = self.timings.setdefault(stage, [0, 0.0] + [0] * len(self.LATENCY_BUCKETS))
+        timing[0] += 1
+        timing[1] += duration
+        for i, bound in enumerate(self.LATENCY_BUCKETS):
+            if duration <= bound:
+                timing[2 + i] += 1
+        if not record['ok']:
+            self._count('stage_errors_total', stage=stage)
+        if record.get('bytes'):
+            self._count('bytes_total', record['bytes'], stage=stage)
+
+    def prometheus(self) -> str:
+        """Metriche in formato testo di Prometheus"""
+        with self._lock:
+            counters = dict(self.counters)
+            timings = {stage: list(values) for stage, values in self.timings.items()}
+
+        def labels(pairs) -> str:
+            escaped = (f'{key}="{self._escape(value)}"' for key, value in pairs)
+            return '{' + ','.join(escaped) + '}' if pairs else ''
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# TYPE {self.PREFIX}_{name} counter')
+            for (counter, pairs), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f'{self.PREFIX}_{name}{labels(pairs)} {value:g}')
+        if timings:
+            name = f'{self.PREFIX}_stage_seconds'
+            lines.append(f'# TYPE {name} histogram')
+            for stage, (count, total, *buckets) in sorted(timings.items()):
+                for bound, cumulative in zip(self.LATENCY_BUCKETS, buckets):
+                    lines.append(f'{name}_bucket{labels([("stage", stage), ("le", f"{bound:g}")])} {cumulative}')
+                lines.append(f'{name}_bucket{labels([("stage", stage), ("le", "+Inf")])} {count}')
+                lines.append(f'{name}_sum{labels([("stage", stage)])} {total:.6f}')
+                lines.append(f'{name}_count{labels([("stage", stage)])} {count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _escape(value) -> str:
+        """Valore di un'etichetta Prometheus con backslash, virgolette e a capo protetti"""
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def write_prometheus(self, path: str):
+        """Scrive le metriche su file in modo atomico (es. per il textfile collector di node_exporter)"""
+        temp_file = path + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+        os.replace(temp_file, path)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> 'ThreadingHTTPServer':
+        """Espone le metriche su http://host:port/metrics in un thread in background"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Solo con --metrics-port
+
+        stream = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                found = self.path.split('?')[0] in ('/', '/metrics')
+                body = stream.prometheus().encode() if found else b'not found\n'
+                self.send_response(200 if found else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Nessun log per ogni scrape
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        return server
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class ConsoleRenderer:
+    """Output per l'utente ricavato dagli eventi di una run: una riga per video e la barra
+
+    Riceve solo gli eventi della propria cartella (più playlist possono scaricare insieme) e
+    ridisegna la barra al massimo ogni `interval` secondi, così migliaia di video completati in
+    rapida successione non rallentano il terminale.
+    """
+
+    def __init__(self, folder: str, total: Optional[int], interval: float = 0.1):
+        self.folder = os.path.normpath(folder)
+        self.progress = ProgressBar(total, min_interval=interval)
+
+    def __call__(self, event: dict):
+        # Alcuni eventi ricavano la cartella dal percorso del file: confronto su percorsi normalizzati
+        if not event.get('folder') or os.path.normpath(event['folder']) != self.folder:
+            return
+        kind = event['event']
+        if kind == 'video_start':
+            print(f"\n{Colors.OKBLUE}⬇️  [{event['index']}] {str(event['title'])[:50]}...{Colors.ENDC}")
+        elif kind == 'video_tagged':
+            print(f"{Colors.OKCYAN}🎯 Metadati aggiunti: {event['artist']} - {event['title'][:30]}...{Colors.ENDC}")
+            if event['cover']:
+                print(f"{Colors.OKGREEN}🖼️  Copertina aggiunta!{Colors.ENDC}")
+        elif kind == 'video_warning':
+            print(f"{Colors.WARNING}⚠️  {event['message']}{Colors.ENDC}")
+        elif kind == 'video_unavailable':
+            print(f"\n{Colors.WARNING}⏭️  Saltato {event['video_id']}: {event['reason']}{Colors.ENDC}")
+        elif kind == 'metadata_failed':
+            print(f"\n{Colors.WARNING}⚠️  Metadati non disponibili: {event['error'][:50]}...{Colors.ENDC}")
+        elif kind == 'throttled':
+            print(f"{Colors.WARNING}🚦 YouTube rallenta le richieste: pausa di {event['delay']:.0f}s{Colors.ENDC}")
+        elif kind == 'video_done':
+            message = "🔗 Già scaricato da un'altra playlist, collegato!" if event.get('linked') \
+                else "✅ Completato con metadati!"
+            print(f"{Colors.OKGREEN}{message}{Colors.ENDC}")
+            self.progress.update()
+        elif kind == 'video_failed':
+            if event.get('failure') == 'permanent':
+                print(f"{Colors.WARNING}⏭️  Non disponibile, saltato: {event['error'][:100]}{Colors.ENDC}")
+            else:
+                print(f"{Colors.FAIL}❌ Errore ({event['stage']}): {event['error'][:100]}{Colors.ENDC}")
+            self.progress.update()
+        elif kind == 'retry' and event.get('kind') == 'video':
+            print(f"{Colors.WARNING}🔁 [{event['index']}] Nuovo tentativo {event['attempt']} tra {event['delay']:.0f}s: "
+                  f"{event['reason'][:80]}{Colors.ENDC}")
+        elif kind == 'video_skipped':
+            self.progress.update()
+        elif kind == 'listing_done':
+            self.progress.set_total(event['total'])
+        elif kind == 'pipeline':
+            report = ' | '.join(f"{stage['stage']}: coda {stage['queue']}, attivi {stage['busy']}/{stage['workers']}"
+                                for stage in event['stages'])
+            print(f"\n{Colors.OKCYAN}📊 {report}{Colors.ENDC}")
+
+
+class QuotaExceededError(Exception):
+    """Quota giornaliera della YouTube Data API (quasi) esaurita"""
+
+
+class TokenBucket:
+    """Token bucket adattivo per un singolo budget di richieste"""
+
+    def __init__(self, rate: float, max_rate: float, min_rate: float = 0.1, base_backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        self.rate = rate  # Richieste al secondo correnti
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.capacity = max(1.0, max_rate)  # Raffica massima
+        self.tokens = 1.0
+        self.throttle_count = 0
+        self._failures = 0  # Rallentamenti consecutivi, per il backoff esponenziale
+        self._blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Attende finché non è disponibile un token"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._blocked_until:
+                    elapsed = now - max(self._updated, self._blocked_until)
+                    self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                    self._updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self._blocked_until - now
+            time.sleep(min(wait, 1.0))
+
+    def throttled(self) -> float:
+        """Risposta di throttling: dimezza la velocità e sospende con backoff esponenziale e jitter"""
+        with self._lock:
+            self.throttle_count += 1
+            self._failures += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            delay = min(self.max_backoff, self.base_backoff * 2 ** (self._failures - 1))
+            delay *= random.uniform(0.5, 1.5)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            self.tokens = 0.0
+            return delay
+
+    def succeeded(self):
+        """Richiesta riuscita: la velocità risale gradualmente (incremento additivo)"""
+        with self._lock:
+            self._failures = 0
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class RateLimiter:
+    """Limitatore condiviso tra tutti i worker, con budget separati per API, media e thumbnail"""
+
+    DEFAULT_BUDGETS = {
+        # budget: (richieste/s iniziali, richieste/s massime)
+        'api': (5.0, 10.0),
+        'media': (1.0, 4.0),
+        'thumbnail': (10.0, 20.0),
+    }
+
+    def __init__(self, budgets: Optional[Dict[str, Tuple[float, float]]] = None):
+        budgets = budgets or self.DEFAULT_BUDGETS
+        self.buckets = {name: TokenBucket(rate, max_rate) for name, (rate, max_rate) in budgets.items()}
+
+    def acquire(self, budget: str):
+        bucket = self.buckets.get(budget)
+        if bucket:
+            bucket.acquire()
+
+    def throttled(self, budget: str) -> float:
+        bucket = self.buckets.get(budget)
+        return bucket.throttled() if bucket else 0.0
+
+    def succeeded(self, budget: str):
+        bucket = self.buckets.get(budget)
+        if bucket:
+            bucket.succeeded()
+
+    def stats(self) -> dict:
+        """Velocità corrente e numero di rallentamenti per ogni budget"""
+        return {name: {'rate': bucket.rate, 'throttled': bucket.throttle_count}
+                for name, bucket in self.buckets.items()}
+
+
+class QuotaTracker:
+    """Conteggio delle unità di quota della Data API, condiviso tra le esecuzioni della giornata
+
+    La quota di Google è per API key e si azzera a mezzanotte ora del Pacifico: il consumo viene
+    salvato in `state_file` (SQLite) per chiave e data. Ogni addebito legge, somma e scrive nella
+    stessa transazione, così più processi contemporanei (batch e worker) non si sovrascrivono.
+    """
+
+    def __init__(self, daily_limit: int = 10000, reserve: int = 100, state_file: Optional[str] = None,
+                 api_key: str = '', timeout: float = 30.0):
+        self.daily_limit = daily_limit
+        self.reserve = reserve  # Unità lasciate libere per fermarsi prima del limite
+        self.state_file = state_file
+        # Solo un'impronta della chiave finisce su disco
+        self.key = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+        self._lock = threading.Lock()
+        self._date = self._today()
+        self._used = 0  # Consumo della giornata senza `state_file`
+        self._conn = None
+        if state_file:
+            try:
+                os.makedirs(os.path.dirname(state_file) or '.', exist_ok=True)
+                self._conn = sqlite3.connect(state_file, timeout=timeout, check_same_thread=False,
+                                             isolation_level=None)
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS usage (
+                        api_key TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        used INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (api_key, date)
+                    )
+                """)
+            except (OSError, sqlite3.Error):
+                self._conn = None  # Il conteggio resta comunque valido per l'esecuzione corrente
+
+    def consume(self, units: int = 1):
+        """Registra il costo di una chiamata, QuotaExceededError se supererebbe il limite"""
+        with self._lock:
+            today = self._today()
+            if today != self._date:
+                self._date, self._used = today, 0  # Nuova giornata di quota
+            if not self._conn:
+                self._check(self._used, units)
+                self._used += units
+                return
+
+            # Lock di scrittura preso subito: il valore letto non cambia fino al COMMIT
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                used = self._read(today)
+                self._check(used, units)
+                self._conn.execute(
+                    """
+                    INSERT INTO usage (api_key, date, used) VALUES (?, ?, ?)
+                    ON CONFLICT(api_key, date) DO UPDATE SET used = usage.used + excluded.used
+                    """,
+                    (self.key, today, units)
+                )
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    @property
+    def used(self) -> int:
+        """Unità consumate oggi con questa API key, da tutti i processi"""
+        with self._lock:
+            today = self._today()
+            if not self._conn:
+                return self._used if today == self._date else 0
+            return self._read(today)
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.daily_limit - self.reserve - self.used)
+
+    def _check(self, used: int, units: int):
+        if used + units > self.daily_limit - self.reserve:
+            raise QuotaExceededError(f"quota giornaliera quasi esaurita ({used}/{self.daily_limit} unità)")
+
+    def _read(self, date: str) -> int:
+        row = self._conn.execute('SELECT used FROM usage WHERE api_key = ? AND date = ?',
+                                 (self.key, date)).fetchone()
+        return row[0] if row else 0
+
+    def _today(self) -> str:
+        try:
+            from zoneinfo import ZoneInfo
+            tz = ZoneInfo('America/Los_Angeles')
+        except Exception:
+            tz = timezone(timedelta(hours=-8))
+        return datetime.now(tz).strftime('%Y-%m-%d')
+
+
+class HttpStatusError(requests.exceptions.HTTPError):
+    """Risposta HTTP con codice di errore, indipendente dal backend usato"""
+
+    def __init__(self, status_code: int, url: str, response=None):
+        super().__init__(f"HTTP {status_code} per {url}", response=response)
+        self.status_code = status_code
+
+
+class HttpClient:
+    """Client HTTP condiviso per API e thumbnail, con pool di connessioni keep-alive
+
+    Usa `requests` con un pool dimensionato sulla concorrenza dei worker; con `http2=True`
+    (e `httpx[http2]` installato) passa a un client HTTP/2 che multiplexa le richieste sulla
+    stessa connessione. Con un `rate_limiter` ogni richiesta consuma un token del proprio budget
+    e le risposte di throttling (429, 403 per rate limit) rallentano il budget e vengono ritentate.
+    """
+
+    USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+    def __init__(self, pool_size: int = 10, http2: bool = False, retries: int = 2,
+                 rate_limiter: Optional[RateLimiter] = None, throttle_retries: int = 5,
+                 events: Optional[EventStream] = None):
+        self.pool_size = max(1, pool_size)
+        self.rate_limiter = rate_limiter
+        self.throttle_retries = throttle_retries
+        self.events = events  # Riceve un evento `retry` per ogni richiesta ritentata
+        self.requests = 0
+        self.connections = 0  # Nuove connessioni TCP+TLS aperte
+        self.connect_time = 0.0
+        self._lock = threading.Lock()
+        self._httpx = None
+        self.session = None
+
+        if http2:
+            try:
+                import httpx
+                # Con un transport esplicito httpx ignora `http2` e `limits` del Client: il pool
+                # va dimensionato sul transport stesso
+                self._client = httpx.Client(
+                    headers={'User-Agent': self.USER_AGENT},
+                    transport=httpx.HTTPTransport(
+                        http2=True, retries=retries,
+                        limits=httpx.Limits(max_connections=self.pool_size,
+                                            max_keepalive_connections=self.pool_size),
+                    ),
+                )
+                self._httpx = httpx
+            except ImportError:
+                print(f"{Colors.WARNING}⚠️  HTTP/2 richiede: pip install httpx[http2]{Colors.ENDC}")
+
+        if self._httpx is None:
+            from urllib3.util.retry import Retry
+            self.session = requests.Session()
+            self.session.headers.update({'User-Agent': self.USER_AGENT})
+            adapter = _TimedHTTPAdapter(
+                self, pool_connections=4, pool_maxsize=self.pool_size,
+                max_retries=Retry(total=retries, connect=retries, read=retries, status=0, backoff_factor=0.5),
+            )
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+
+    def get(self, url: str, params: Optional[dict] = None, timeout: float = 10, budget: Optional[str] = None,
+            on_attempt: Optional[Callable[[], None]] = None):
+        """GET con controllo dello stato: solleva eccezioni di `requests` con entrambi i backend
+
+        `budget` indica il budget del rate limiter da usare ('api', 'media', 'thumbnail').
+        `on_attempt` viene chiamata prima di ogni invio, compresi quelli ripetuti dopo un throttling
+        (es. per addebitare la quota dell'API); se solleva un'eccezione la richiesta non parte.
+        """
+        limiter = self.rate_limiter if budget else None
+        attempt = 0
+        while True:
+            if limiter:
+                limiter.acquire(budget)  # Attende anche l'eventuale backoff in corso
+            if on_attempt:
+                on_attempt()
+            response = self._send(url, params, timeout)
+
+            if response.status_code < 400:
+                if limiter:
+                    limiter.succeeded(budget)
+                return response
+
+            if self.is_throttled(response) and limiter and attempt < self.throttle_retries:
+                attempt += 1
+                limiter.throttled(budget)
+                if self.events:
+                    self.events.emit('retry', kind=budget, reason=f"HTTP {response.status_code}",
+                                     attempt=attempt, url=str(url).split('?')[0])
+                continue
+            raise HttpStatusError(response.status_code, str(url), response=response)
+
+    @contextlib.contextmanager
+    def stream(self, url: str, headers: Optional[dict] = None, timeout: float = 30, chunk_size: int = 64 * 1024):
+        """GET in streaming: restituisce (header della risposta, iteratore dei byte) senza leggere
+        tutto il corpo in memoria"""
+        with self._lock:
+            self.requests += 1
+
+        if self._httpx is None:
+            response = self.session.get(url, headers=headers, timeout=timeout, stream=True)
+            try:
+                if response.status_code >= 400:
+                    response.content  # Corpo dell'errore letto prima della chiusura
+                    raise HttpStatusError(response.status_code, url.split('?')[0], response=response)
+                yield response.headers, response.iter_content(chunk_size)
+            finally:
+                response.close()
+            return
+
+        try:
+            with self._client.stream('GET', url, headers=headers, timeout=timeout,
+                                     extensions={'trace': self._trace()}) as response:
+                if response.status_code >= 400:
+                    response.read()  # Corpo dell'errore (es. motivo del rate limit) leggibile da chi lo gestisce
+                    raise HttpStatusError(response.status_code, url.split('?')[0], response=response)
+                yield response.headers, response.iter_bytes(chunk_size)
+        except self._httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except self._httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+    def is_throttled(self, response) -> bool:
+        """True se la risposta indica un rallentamento richiesto dal server"""
+        if response.status_code == 429:
+            return True
+        return response.status_code == 403 and api_error_reason(response) in self.RATE_LIMIT_REASONS
+
+    def _send(self, url: str, params: Optional[dict], timeout: float):
+        """Esegue una singola richiesta con il backend configurato"""
+        with self._lock:
+            self.requests += 1
+
+        if self._httpx is None:
+            return self.session.get(url, params=params, timeout=timeout)
+        try:
+            return self._client.get(url, params=params, timeout=timeout, extensions={'trace': self._trace()})
+        except self._httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except self._httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+    def record_connect(self, seconds: float):
+        """Registra l'apertura di una nuova connessione e la sua durata"""
+        with self._lock:
+            self.connections += 1
+            self.connect_time += seconds
+
+    def stats(self) -> dict:
+        """Statistiche del pool: richieste, connessioni, quota di riuso e tempo medio di connessione"""
+        with self._lock:
+            requests_count, connections, connect_time = self.requests, self.connections, self.connect_time
+        return {
+            'requests': requests_count,
+            'connections': connections,
+            'reuse_ratio': 1 - connections / requests_count if requests_count else 0.0,
+            'avg_connect_ms': connect_time / connections * 1000 if connections else 0.0,
+            'http2': self._httpx is not None,
+        }
+
+    def close(self):
+        """Chiude le connessioni aperte"""
+        if self._httpx is not None:
+            self._client.close()
+        else:
+            self.session.close()
+
+    def _trace(self) -> Callable:
+        """Callback httpcore che misura la durata di connessione TCP+TLS di una richiesta"""
+        started = {}
+
+        def trace(event_name: str, info: dict):
+            if event_name == 'connection.connect_tcp.started':
+                started['time'] = time.perf_counter()
+            elif 'time' in started and not event_name.startswith('connection.'):
+                # Prima operazione dopo la connessione: TCP e TLS completati
+                self.record_connect(time.perf_counter() - started.pop('time'))
+
+        return trace
+
+
+def api_error_reason(response) -> Optional[str]:
+    """Motivo dell'errore restituito dalle API Google (es. 'quotaExceeded'), se presente"""
+    try:
+        errors = response.json().get('error', {}).get('errors') or [{}]
+    except (ValueError, AttributeError):
+        return None
+    return errors[0].get('reason')
+
+
+class _TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """Adapter requests che misura le nuove connessioni aperte dal pool urllib3"""
+
+    def __init__(self, client: HttpClient, **kwargs):
+        self.client = client
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        from urllib3.connection import HTTPConnection, HTTPSConnection
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+        client = self.client
+
+        class TimedHTTPConnection(HTTPConnection):
+            def connect(self):
+                start = time.perf_counter()
+                super().connect()
+                client.record_connect(time.perf_counter() - start)
+
+        class TimedHTTPSConnection(HTTPSConnection):
+            def connect(self):
+                start = time.perf_counter()
+                super().connect()  # Include l'handshake TLS
+                client.record_connect(time.perf_counter() - start)
+
+        class TimedHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = TimedHTTPConnection
+
+        class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = TimedHTTPSConnection
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+def process_cover_image(data: bytes, max_size: Tuple[int, int] = (500, 500)) -> bytes:
+    """Converte un'immagine in una copertina JPEG ridimensionata (eseguita anche nei processi del pool)"""
+    from PIL import Image
+
+    img = Image.open(BytesIO(data))
+
+    # I JPEG vengono decodificati direttamente a risoluzione ridotta (scalatura DCT), così il
+    # ricampionamento finale lavora su molti meno pixel. La richiesta va fatta sulla dimensione
+    # finale con le proporzioni dell'originale: con (500, 500) un 1280x720 non verrebbe mai ridotto
+    if img.format == 'JPEG':
+        scale = min(max_size[0] / img.width, max_size[1] / img.height)
+        if scale < 1:
+            img.draft('RGB', (max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+
+    # Ridimensiona se troppo grande (ottimizzazione per Android)
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    # Converti in JPEG se necessario
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # Salva immagine ottimizzata
+    img_buffer = BytesIO()
+    img.save(img_buffer, format='JPEG', quality=85, optimize=True)
+    return img_buffer.getvalue()
+
+
+class CoverArtProcessor:
+    """Elaborazione delle copertine in un pool di processi, con cache per hash del contenuto"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size: Tuple[int, int] = (500, 500),
+                 memory_items: int = 256, disk_items: int = 5000, processes: Optional[int] = None):
+        self.cache_dir = cache_dir  # None disattiva la cache su disco
+        self.max_size = max_size
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.processes = processes or min(4, os.cpu_count() or 1)
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # hash → JPEG, in ordine di utilizzo (LRU)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._disk_writes = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def process(self, data: bytes) -> bytes:
+        """Restituisce la copertina elaborata, riusando quella in cache se già vista"""
+        key = hashlib.sha1(data).hexdigest()
+
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            self.misses += 1
+        result = self._run(data)
+        self._cache_put(key, result)
+        return result
+
+    def shutdown(self):
+        """Chiude il pool di processi (viene ricreato al prossimo utilizzo)"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True)
+
+    def _run(self, data: bytes) -> bytes:
+        """Elabora l'immagine in un processo separato, fuori dal GIL dei thread di download"""
+        with self._lock:
+            if self._pool is None and self.processes > 0:
+                try:
+                    # Caricati alla prima copertina: l'elenco delle playlist non li usa
+                    import multiprocessing
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    # 'spawn': un fork a metà run copierebbe nel worker i pipe aperti dai thread che
+                    # stanno avviando ffmpeg, e subprocess resterebbe in attesa per sempre
+                    self._pool = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                except (OSError, NotImplementedError):
+                    self.processes = 0  # Processi non disponibili: elaborazione nel thread corrente
+            pool = self._pool
+
+        if pool is None:
+            return process_cover_image(data, self.max_size)
+        return pool.submit(process_cover_image, data, self.max_size).result()
+
+    def _cache_get(self, key: str) -> Optional[bytes]:
+        """Cerca la copertina prima in memoria, poi su disco"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{key}.jpg")
+            try:
+                with open(path, 'rb') as f:
+                    result = f.read()
+                os.utime(path)  # Aggiorna l'ultimo utilizzo per l'eviction
+            except OSError:
+                return None
+            self._remember(key, result)
+            with self._lock:
+                self.hits += 1
+            return result
+        return None
+
+    def _cache_put(self, key: str, result: bytes):
+        """Salva la copertina in memoria e su disco"""
+        self._remember(key, result)
+        if not self.cache_dir:
+            return
+
+        path = os.path.join(self.cache_dir, f"{key}.jpg")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(result)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            evict = self._disk_writes % 100 == 0
+        if evict:
+            self._evict_disk()
+
+    def _remember(self, key: str, result: bytes):
+        """Inserisce nella cache LRU in memoria, scartando le voci meno usate"""
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Mantiene la cache su disco entro `disk_items` file, eliminando i meno usati"""
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.jpg')]
+        except OSError:
+            return
+        if len(entries) <= self.disk_items:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.disk_items]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class DownloadArchive:
+    """Indice persistente (SQLite) dei video scaricati, salvato nella cartella di download"""
+
+    FILENAME = '.download_archive.sqlite'
+
+    def __init__(self, download_folder: str):
+        self.path = os.path.join(download_folder, self.FILENAME)
+        self._lock = threading.Lock()  # Connessione condivisa tra i worker
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                url TEXT,
+                title TEXT,
+                status TEXT NOT NULL,
+                filepath TEXT,
+                filesize INTEGER,
+                tagged INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def record(self, video_id: str, url: str, status: str, title: Optional[str] = None,
+               filepath: Optional[str] = None, tagged: bool = False, error: Optional[str] = None):
+        """Registra (o aggiorna) lo stato di un video"""
+        filesize = None
+        if filepath and os.path.exists(filepath):
+            filesize = os.path.getsize(filepath)
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO videos (video_id, url, title, status, filepath, filesize, tagged, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    url = excluded.url,
+                    title = COALESCE(excluded.title, videos.title),
+                    status = excluded.status,
+                    filepath = COALESCE(excluded.filepath, videos.filepath),
+                    filesize = COALESCE(excluded.filesize, videos.filesize),
+                    tagged = excluded.tagged,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+                """,
+                (video_id, url, title, status, filepath, filesize, int(tagged), error,
+                 datetime.now().isoformat(timespec='seconds'))
+            )
+            self._conn.commit()
+
+    def completed_ids(self) -> set:
+        """Restituisce gli ID dei video già scaricati il cui file è ancora presente"""
+        return set(self.completed_files())
+
+    def unavailable_ids(self, max_age: Optional[float] = None) -> set:
+        """ID dei video non scaricabili (privati, rimossi, bloccati...), saltati dalle sincronizzazioni
+
+        Con `max_age` (giorni) restano esclusi solo quelli verificati più di recente: gli altri
+        vengono ricontrollati, perché un video può tornare pubblico o disponibile.
+        """
+        query, params = "SELECT video_id FROM videos WHERE status = 'unavailable'", ()
+        if max_age is not None:
+            query += " AND updated_at > ?"
+            params = ((datetime.now() - timedelta(days=max_age)).isoformat(timespec='seconds'),)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {video_id for video_id, in rows}
+
+    def completed_files(self) -> Dict[str, str]:
+        """Percorso del file di ogni video già scaricato e ancora presente"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id, filepath FROM videos WHERE status = 'done'"
+            ).fetchall()
+        return {video_id: filepath for video_id, filepath in rows if filepath and os.path.exists(filepath)}
+
+    def close(self):
+        """Chiude la connessione al database"""
+        with self._lock:
+            self._conn.close()
+
+
+class JobJournal:
+    """Diario append-only (JSON lines) dei passaggi di stadio di ogni video
+
+    Ogni riga viene scritta e sincronizzata su disco prima di proseguire, così dopo un crash
+    o un'interruzione la run successiva riprende ogni video dall'ultimo stadio completato.
+    Il file viene eliminato quando una run termina senza interruzioni.
+    """
+
+    FILENAME = '.download_journal.jsonl'
+    STAGES = ('listed', 'fetched', 'transcoded', 'tagged')
+    INFO_KEYS = ('id', 'title', 'uploader', 'upload_date', 'duration', 'view_count', 'description', 'thumbnail',
+                 'acodec')
+
+    def __init__(self, download_folder: str):
+        self.path = os.path.join(download_folder, self.FILENAME)
+        self._lock = threading.Lock()
+        self._file = None
+        self.state: Dict[str, dict] = {}  # Ultimo stato noto per video
+        self.listings: Dict[str, Dict[str, None]] = {}  # Video elencati per sorgente, in ordine
+        self.complete_listings: set = set()  # Sorgenti elencate per intero
+
+    def exists(self) -> bool:
+        """True se una run precedente è stata interrotta lasciando il diario"""
+        return os.path.exists(self.path)
+
+    def load(self) -> Dict[str, dict]:
+        """Rilegge il diario e ricostruisce lo stato di ogni video"""
+        if not self.exists():
+            return self.state
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Riga troncata da un crash durante la scrittura
+                self._apply(entry)
+        return self.state
+
+    def _apply(self, entry: dict):
+        """Aggiorna lo stato in memoria con una voce del diario"""
+        stage = entry.pop('stage', None)
+        if stage == 'listing_complete':
+            self.complete_listings.add(entry.get('source'))
+            return
+        video_id = entry.pop('video_id', None)
+        if not video_id:
+            return
+        state = self.state.setdefault(video_id, {})
+        if stage == 'listed' and entry.get('source'):
+            self.listings.setdefault(entry['source'], {})[video_id] = None
+        if stage in self.STAGES and not (stage == 'listed' and 'stage' in state):
+            state['stage'] = stage  # Un nuovo elenco non annulla i progressi già registrati
+        state.update(entry)
+
+    def record(self, video_id: Optional[str], stage: str, sync: bool = True, **data):
+        """Aggiunge una voce al diario; con `sync` attende la scrittura effettiva su disco"""
+        entry = {'video_id': video_id, 'stage': stage, **data}
+        line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+            self._apply(entry)
+
+    def listed_entries(self, source: Optional[str]) -> Optional[List[Tuple[str, Optional[dict]]]]:
+        """Elenco (url, metadati) salvato per una sorgente, se era stato caricato per intero"""
+        if not source or source not in self.complete_listings:
+            return None
+        return [(self.state[video_id]['url'], self.state[video_id].get('metadata'))
+                for video_id in self.listings.get(source, {})]
+
+    @classmethod
+    def info_subset(cls, info: Optional[dict]) -> dict:
+        """Campi dell'info dict necessari ai tag, serializzabili nel diario"""
+        return {key: info[key] for key in cls.INFO_KEYS if info and info.get(key) is not None}
+
+    def close(self, finished: bool = False):
+        """Chiude il diario; se la run è terminata senza interruzioni lo elimina"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if finished and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class WorkQueue:
+    """Coda di lavoro condivisa (SQLite) nella cartella di output, per più processi o macchine
+
+    I worker reclamano i video con un lease da rinnovare periodicamente: se un worker muore i
+    suoi video tornano disponibili agli altri alla scadenza del lease. Il database usa il journal
+    classico invece di WAL, che non funziona su file system condivisi.
+    """
+
+    FILENAME = '.work_queue.sqlite'
+    STAGING_DIR = '.staging'  # File intermedi di ogni worker, sullo stesso file system dell'output
+    LISTING_BACKOFF = (30.0, 300.0)  # Attesa iniziale e massima prima di riprovare un elenco fallito (s)
+
+    def __init__(self, folder: str, lease: float = 300.0, max_attempts: int = 3, timeout: float = 60.0):
+        self.folder = folder
+        self.path = os.path.join(folder, self.FILENAME)
+        self.lease = lease  # Secondi di validità di un claim senza heartbeat
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Transazioni esplicite (BEGIN IMMEDIATE) per claim atomici tra processi
+        self._conn = sqlite3.connect(self.path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=DELETE')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                video_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                metadata TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                filepath TEXT,
+                error TEXT
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS items_status ON items (status, position)')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                worker TEXT,
+                lease_until REAL NOT NULL DEFAULT 0
+            )
+        """)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Transazione con lock di scrittura preso subito: nessun altro processo può interferire"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def acquire_listing(self, worker: str) -> bool:
+        """True se tocca a questo worker caricare l'elenco (non completo e nessun altro lo sta facendo)"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value, worker, lease_until FROM state WHERE key = 'listing'").fetchone()
+            if row and (row[0] in ('complete', 'failed') or (row[1] != worker and row[2] > now)):
+                return False
+            conn.execute("INSERT OR REPLACE INTO state VALUES ('listing', 'running', ?, ?)", (worker, now + self.lease))
+            return True
+
+    def add(self, entries: Iterable[Tuple[str, str, Optional[dict]]], worker: str, batch_size: int = 50) -> int:
+        """Accoda i video (id, url, metadati) non ancora presenti; restituisce quanti sono stati aggiunti"""
+        added = 0
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                added += self._add_batch(batch, worker)
+                batch = []
+        if batch:
+            added += self._add_batch(batch, worker)
+        return added
+
+    def _add_batch(self, batch: List[Tuple[str, str, Optional[dict]]], worker: str) -> int:
+        """Inserisce un blocco di video e rinnova il lease dell'elenco"""
+        with self._transaction() as conn:
+            position = conn.execute('SELECT COALESCE(MAX(position), 0) FROM items').fetchone()[0]
+            before = conn.total_changes
+            for video_id, url, metadata in batch:
+                position += 1
+                conn.execute(
+                    'INSERT OR IGNORE INTO items (video_id, url, position, metadata) VALUES (?, ?, ?, ?)',
+                    (video_id, url, position, json.dumps(metadata) if metadata else None)
+                )
+            added = conn.total_changes - before
+            conn.execute("UPDATE state SET lease_until = ? WHERE key = 'listing' AND worker = ?",
+                         (time.time() + self.lease, worker))
+        return added
+
+    def finish_listing(self, worker: str):
+        """Segna l'elenco come completo"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE state SET value = 'complete' WHERE key = 'listing' AND worker = ?", (worker,))
+
+    def fail_listing(self, worker: str, error: str) -> Optional[float]:
+        """Registra un caricamento dell'elenco non riuscito
+
+        L'elenco viene riprovato (da qualunque worker) dopo un backoff esponenziale; dopo
+        `max_attempts` errori viene segnato come fallito. Restituisce l'attesa, None se fallito.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM state WHERE key = 'listing_failures'").fetchone()
+            failures = int(row[0]) + 1 if row else 1
+            conn.execute("INSERT OR REPLACE INTO state VALUES ('listing_failures', ?, ?, 0)", (str(failures), worker))
+            conn.execute("INSERT OR REPLACE INTO state VALUES ('listing_error', ?, ?, 0)", (error, worker))
+            if failures >= self.max_attempts:
+                conn.execute("UPDATE state SET value = 'failed', lease_until = 0 WHERE key = 'listing'")
+                return None
+            base, maximum = self.LISTING_BACKOFF
+            delay = min(maximum, base * 2 ** (failures - 1))
+            # Nessun worker (neanche questo) lo riprende prima della scadenza
+            conn.execute("UPDATE state SET value = 'retry', worker = '', lease_until = ? WHERE key = 'listing'",
+                         (time.time() + delay,))
+            return delay
+
+    def claim(self, worker: str, limit: int = 1) -> List[Tuple[str, Optional[dict]]]:
+        """Reclama i prossimi video liberi o con lease scaduto
+
+        Un lease scaduto che ha già esaurito i tentativi (es. un video che fa terminare ogni worker
+        che lo prende) viene segnato come fallito invece di essere riassegnato.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                UPDATE items SET status = 'failed', lease_until = 0,
+                                 error = COALESCE(error, 'lease scaduto a ogni tentativo (worker terminato?)')
+                WHERE status = 'claimed' AND lease_until < ? AND attempts >= ?
+                """,
+                (now, self.max_attempts)
+            )
+            rows = conn.execute(
+                """
+                SELECT video_id, url, metadata FROM items
+                WHERE status = 'pending' OR (status = 'claimed' AND lease_until < ?)
+                ORDER BY position LIMIT ?
+                """,
+                (now, limit)
+            ).fetchall()
+            for video_id, _, _ in rows:
+                conn.execute(
+                    """
+                    UPDATE items SET status = 'claimed', worker = ?, lease_until = ?, attempts = attempts + 1
+                    WHERE video_id = ?
+                    """,
+                    (worker, now + self.lease, video_id)
+                )
+        return [(url, json.loads(metadata) if metadata else None) for _, url, metadata in rows]
+
+    def heartbeat(self, worker: str):
+        """Rinnova i lease di tutti i video (e dell'elenco) in mano al worker"""
+        until = time.time() + self.lease
+        with self._transaction() as conn:
+            conn.execute("UPDATE items SET lease_until = ? WHERE status = 'claimed' AND worker = ?", (until, worker))
+            conn.execute("UPDATE state SET lease_until = ? WHERE worker = ? AND value = 'running'", (until, worker))
+
+    def release(self, worker: str):
+        """Rimette in coda i video di un worker (es. riavviato con lo stesso ID)"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE items SET status = 'pending', lease_until = 0 WHERE status = 'claimed' AND worker = ?",
+                         (worker,))
+
+    def fail(self, video_id: str, worker: str, error: str, permanent: bool = False):
+        """Registra un errore: il video torna in coda finché non esaurisce i tentativi
+
+        Un errore `permanent` (video privato, rimosso...) chiude subito il video senza altri tentativi.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                UPDATE items SET status = CASE WHEN ? OR attempts >= ? THEN 'failed' ELSE 'pending' END,
+                                 lease_until = 0, error = ?
+                WHERE video_id = ? AND status = 'claimed' AND worker = ?
+                """,
+                (permanent, self.max_attempts, error, video_id, worker)
+            )
+
+    def finalize(self, video_id: str, path: str, worker: str) -> Optional[str]:
+        """Sposta il file finito nella cartella di output (rename atomico) e completa il video
+
+        Il nome viene dal titolo: se è già occupato (un altro video con lo stesso titolo, o un file
+        non della coda) si aggiunge l'ID del video invece di sovrascrivere. Controllo e rename
+        avvengono nella stessa transazione, quindi due worker non possono scegliere lo stesso nome.
+        Se il worker ha perso il claim (lease scaduto e video ripreso da un altro) il file in staging
+        viene eliminato e restituisce None: il video lo completa chi lo detiene ora.
+        """
+        target = os.path.join(self.folder, os.path.basename(path))
+        with self._transaction() as conn:
+            claimed = conn.execute("SELECT 1 FROM items WHERE video_id = ? AND status = 'claimed' AND worker = ?",
+                                   (video_id, worker)).fetchone()
+            if not claimed:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                return None
+            owner = conn.execute("SELECT video_id FROM items WHERE filepath = ? AND video_id != ?",
+                                 (target, video_id)).fetchone()
+            if owner or os.path.exists(target):
+                stem, ext = os.path.splitext(os.path.basename(path))
+                target = os.path.join(self.folder, f"{stem} [{video_id}]{ext}")
+                # Anche il nome con l'ID può esistere (file lasciato da altri): si numera
+                n = 2
+                while os.path.exists(target):
+                    target = os.path.join(self.folder, f"{stem} [{video_id}] ({n}){ext}")
+                    n += 1
+            os.replace(path, target)  # Mai file troncati o parziali nella cartella di output
+            conn.execute(
+                "UPDATE items SET status = 'done', worker = ?, filepath = ?, error = NULL WHERE video_id = ?",
+                (worker, target, video_id)
+            )
+        return target
+
+    def in_flight(self, worker: str) -> int:
+        """Video reclamati dal worker e non ancora conclusi"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM items WHERE status = 'claimed' AND worker = ?",
+                                      (worker,)).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        """Numero di video per stato"""
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM items GROUP BY status').fetchall()
+            listing = self._conn.execute("SELECT value FROM state WHERE key = 'listing'").fetchone()
+        counts = dict(rows)
+        counts['listing_complete'] = bool(listing and listing[0] == 'complete')
+        counts['listing_failed'] = bool(listing and listing[0] == 'failed')
+        return counts
+
+    def listing_error(self) -> Optional[str]:
+        """Ultimo errore del caricamento dell'elenco, se c'è stato"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = 'listing_error'").fetchone()
+        return row[0] if row else None
+
+    def iter_claims(self, worker: str, max_in_flight: int, poll: float = 2.0,
+                    on_idle: Optional[Callable[[], None]] = None) -> Iterator[Tuple[str, Optional[dict]]]:
+        """Video da elaborare, reclamati uno alla volta senza superare `max_in_flight` in lavorazione
+
+        Termina quando l'elenco è completo (o definitivamente fallito) e non restano video in coda
+        o in mano ad altri worker. `on_idle` viene chiamato quando non c'è nulla da reclamare (es.
+        per riprendere l'elenco).
+        """
+        while True:
+            if self.in_flight(worker) < max_in_flight:
+                claimed = self.claim(worker)
+                if claimed:
+                    yield claimed[0]
+                    continue
+                counts = self.counts()
+                listed = counts['listing_complete'] or counts['listing_failed']
+                if listed and not counts.get('pending') and not counts.get('claimed'):
+                    return
+                if on_idle and not listed:
+                    on_idle()
+            time.sleep(poll)
+
+    def close(self):
+        """Chiude la connessione al database"""
+        with self._lock:
+            self._conn.close()
+
+
+class SharedFiles:
+    """Indice dei video elaborati nella sessione, condiviso tra le playlist di un batch
+
+    Il primo job che reclama un video lo scarica; gli altri ricevono un Future con il percorso
+    del file finale e lo collegano nella propria cartella (hard link, oppure copia).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files: Dict[str, Future] = {}
+        self.linked = 0
+
+    def claim(self, video_id: str) -> Optional[Future]:
+        """None se il chiamante deve elaborare il video, altrimenti il Future del proprietario"""
+        with self._lock:
+            shared = self._files.get(video_id)
+            if shared is not None and not (shared.done() and not self._usable(shared.result())):
+                return shared
+            self._files[video_id] = Future()  # Nuovo proprietario (o il precedente è fallito)
+            return None
+
+    def resolve(self, video_id: str, path: Optional[str]):
+        """Pubblica il file finale del video (None se l'elaborazione è fallita)"""
+        with self._lock:
+            shared = self._files.get(video_id)
+            if shared is not None and not shared.done():
+                shared.set_result(path)
+
+    def add(self, video_id: str, path: str):
+        """Registra un file già presente su disco (es. da una run precedente)"""
+        with self._lock:
+            shared = self._files.get(video_id)
+            if shared is None or (shared.done() and not self._usable(shared.result())):
+                shared = self._files[video_id] = Future()
+            if not shared.done():
+                shared.set_result(path)
+
+    def place(self, path: str, folder: str) -> str:
+        """Collega il file nella cartella indicata: hard link se possibile, altrimenti copia"""
+        target = os.path.join(folder, os.path.basename(path))
+        if os.path.exists(target):
+            return target
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)  # File system diversi o link non supportati
+        with self._lock:
+            self.linked += 1
+        return target
+
+    @staticmethod
+    def _usable(path: Optional[str]) -> bool:
+        return bool(path) and os.path.exists(path)
+
+
+class VideoJob:
+    """Manifest di un singolo video lungo la pipeline download → transcodifica → tag
+
+    Contiene i percorsi reali dei file prodotti da yt-dlp (audio, thumbnail, info json), così
+    tag e pulizia lavorano solo su file noti senza cercare nella cartella.
+    """
+
+    def __init__(self, index: int, url: str, video_id: str, download_folder: str,
+                 metadata: Optional[dict] = None):
+        self.index = index
+        self.url = url
+        self.video_id = video_id
+        self.download_folder = download_folder
+        self.metadata = metadata  # Metadati da videos.list (se disponibili)
+        self.prefetched = None  # Future con le info risolte in anticipo da yt-dlp
+        self.info = None  # Info dict usato per i tag
+        self.source_file = None  # Audio scaricato, prima della transcodifica
+        self.thumbnail_file = None
+        self.infojson_file = None
+        self.audio_file = None  # File finale: MP3 oppure audio nativo (m4a/opus)
+        self.cover_data = None  # Bytes della copertina passati in memoria allo stadio di tag
+        self.media_bytes = 0  # Byte dell'audio scaricato (file o stream)
+        self.attempts = 0  # Nuovi tentativi di download già programmati
+        self.retrying = False  # In attesa (o nel mezzo) di un nuovo tentativo
+        self.tagged = False
+
+    def temp_files(self) -> List[str]:
+        """File accessori da eliminare a fine elaborazione"""
+        return [path for path in (self.thumbnail_file, self.infojson_file) if path]
+
+
+class YdlEventLogger:
+    """Logger per yt-dlp: trasforma i tentativi ripetuti in eventi `retry`
+
+    Come con `quiet` e `no_warnings`, messaggi e avvisi non vengono mostrati; gli errori
+    continuano ad andare su stderr.
+    """
+
+    RETRY_PATTERN = re.compile(r'Retrying.*\((\d+)/(\d+|inf)\)')
+
+    def __init__(self, events: EventStream):
+        self.events = events
+
+    def debug(self, message: str):
+        pass
+
+    def info(self, message: str):
+        pass
+
+    def warning(self, message: str):
+        match = self.RETRY_PATTERN.search(message)
+        if match:
+            self.events.emit('retry', kind='media', reason=message.split('. Retrying')[0][:200],
+                             attempt=int(match.group(1)))
+
+    def error(self, message: str):
+        print(message, file=sys.stderr)
+
+
+def in_memory_handoff_pp(app: 'YouTubePlaylistDownloader', downloader=None):
+    """Crea il post-processor che passa info dict e copertina in memoria allo stadio di tag"""
+    return _in_memory_handoff_pp_class()(app, downloader)
+
+
+@functools.lru_cache(maxsize=None)
+def _in_memory_handoff_pp_class() -> type:
+    """Classe del post-processor, definita al primo utilizzo: la base PostProcessor
+    richiede l'import di yt-dlp, che così avviene solo quando si scarica davvero"""
+    from yt_dlp.postprocessor import PostProcessor
+
+    class InMemoryHandoffPP(PostProcessor):
+        """Post-processor yt-dlp che passa info dict e copertina in memoria allo stadio di tag,
+        senza scrivere su disco thumbnail e info json"""
+
+        def __init__(self, app: 'YouTubePlaylistDownloader', downloader=None):
+            super().__init__(downloader)
+            self.app = app
+
+        def run(self, information):
+            job = self.app._job_for_hook({'info_dict': information})
+            if job:
+                job.source_file = information.get('filepath') or job.source_file
+                thumbnail_url = (job.metadata or {}).get('thumbnail') or information.get('thumbnail')
+                if thumbnail_url:
+                    job.cover_data = self.app.fetch_thumbnail_data(thumbnail_url)
+            return [], information
+
+    return InMemoryHandoffPP
+
+
+class PipelineStage:
+    """Stadio della pipeline: un pool di thread che consuma una coda limitata"""
+
+    def __init__(self, name: str, workers: int, handler: Callable, queue_size: int, on_done: Callable,
+                 on_error: Callable, stop_event: threading.Event, worker_context: Optional[Callable] = None):
+        self.name = name
+        self.workers = max(1, workers)
+        self.handler = handler  # handler(job, context)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.on_done = on_done  # Riceve il job completato (es. put dello stadio successivo)
+        self.on_error = on_error  # Riceve job, nome dello stadio ed eccezione
+        self.stop_event = stop_event
+        self.worker_context = worker_context  # Risorsa per thread (es. istanza YoutubeDL)
+        self.busy = 0
+        self.pending = 0  # Job accodati o in lavorazione (esclusi i segnali di chiusura)
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.max_depth = 0
+        self.durations: List[float] = []  # Secondi di lavorazione di ogni job
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Avvia i thread dello stadio"""
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, job) -> bool:
+        """Accoda un job attendendo spazio, False se la pipeline è stata interrotta"""
+        if job is not None:
+            with self._lock:
+                self.pending += 1  # Prima dell'inserimento: un worker potrebbe già concluderlo
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(job, timeout=0.5)
+            except queue.Full:
+                continue
+            with self._lock:
+                self.max_depth = max(self.max_depth, self.queue.qsize())
+            return True
+        if job is not None:
+            with self._lock:
+                self.pending -= 1
+        return False
+
+    def close(self):
+        """Segnala la fine dei job: i thread terminano dopo aver svuotato la coda"""
+        for _ in self._threads:
+            if not self.put(None):
+                return
+
+    def is_alive(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def join(self, timeout: Optional[float] = None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def utilization(self, elapsed: float) -> float:
+        """Frazione del tempo in cui i thread dello stadio sono stati occupati"""
+        if elapsed <= 0:
+            return 0.0
+        return min(1.0, self.busy_time / (elapsed * self.workers))
+
+    def _run(self):
+        """Ciclo di un thread dello stadio"""
+        context = self.worker_context() if self.worker_context else contextlib.nullcontext()
+        with context as resource:
+            while not self.stop_event.is_set():
+                try:
+                    job = self.queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if job is None:
+                    break
+
+                with self._lock:
+                    self.busy += 1
+                start = time.monotonic()
+                try:
+                    # Anche un errore di on_done (archivio, diario, rename...) chiude il job con on_error:
+                    # un thread terminato lascerebbe bloccati put() e close() sulla coda limitata
+                    self.handler(job, resource)
+                    self.on_done(job)
+                except Exception as e:
+                    with self._lock:
+                        self.failed += 1
+                    self._report_error(job, e)
+                else:
+                    with self._lock:
+                        self.processed += 1
+                finally:
+                    duration = time.monotonic() - start
+                    with self._lock:
+                        self.busy -= 1
+                        self.pending -= 1  # Dopo on_done/on_error, che possono programmare un nuovo tentativo
+                        self.busy_time += duration
+                        self.durations.append(duration)
+
+    def _report_error(self, job, error: Exception):
+        """Passa l'errore a on_error senza mai far terminare il thread dello stadio"""
+        try:
+            self.on_error(job, self.name, error)
+        except Exception as e:
+            print(f"{Colors.FAIL}❌ Errore interno ({self.name}): {type(e).__name__}: {e}{Colors.ENDC}",
+                  file=sys.stderr)
+
+
+class RetryQueue:
+    """Nuovi tentativi ritardati per i download falliti per errori temporanei o throttling
+
+    I job attendono qui la scadenza del backoff senza occupare un worker, poi tornano nella coda
+    dello stadio di download: i video sani continuano a scaricare nel frattempo. `drain` attende
+    che lo stadio non abbia più job in corso (un primo tentativo può ancora fallire e programmarne
+    un altro) e che ogni tentativo programmato sia concluso, prima di chiudere lo stadio.
+    """
+
+    def __init__(self, put: Callable, stop_event: threading.Event, base_delay: float = 5.0,
+                 max_delay: float = 120.0):
+        self.put = put  # Reinserisce il job nello stadio di download
+        self.stop_event = stop_event
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.scheduled = 0  # Tentativi programmati in tutta la run
+        self._heap = []  # (scadenza, sequenza, job)
+        self._sequence = itertools.count()
+        self._pending = 0  # Job in attesa o in un tentativo non ancora concluso
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="retry-queue", daemon=True)
+        self._thread.start()
+
+    def backoff(self, attempt: int) -> float:
+        """Attesa prima del tentativo `attempt` (da 1): esponenziale con jitter, limitata a `max_delay`"""
+        delay = self.base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        return min(self.max_delay, delay)
+
+    def schedule(self, job, delay: float):
+        """Programma un nuovo tentativo del job fra `delay` secondi"""
+        with self._cond:
+            if not job.retrying:
+                job.retrying = True
+                self._pending += 1
+            self.scheduled += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), job))
+            self._cond.notify_all()
+
+    def finished(self, job):
+        """Il download del job si è concluso: se era un nuovo tentativo non è più in sospeso"""
+        with self._cond:
+            if job.retrying:
+                job.retrying = False
+                self._pending -= 1
+                self._cond.notify_all()
+
+    def drain(self, stage: 'PipelineStage'):
+        """Attende che `stage` sia vuoto e i tentativi programmati conclusi, restando reattiva a Ctrl+C"""
+        with self._cond:
+            while (self._pending or stage.pending) and stage.is_alive() and not self.stop_event.is_set():
+                self._cond.wait(0.1)  # Lo stadio non notifica: controllo periodico
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _run(self):
+        """Restituisce allo stadio di download i job il cui backoff è scaduto"""
+        while not self.stop_event.is_set():
+            with self._cond:
+                if self._closed:
+                    return
+                if not self._heap or self._heap[0][0] > time.monotonic():
+                    wait = self._heap[0][0] - time.monotonic() if self._heap else 0.5
+                    self._cond.wait(min(max(wait, 0.0), 0.5))
+                    continue
+                _, _, job = heapq.heappop(self._heap)
+            if not self.put(job):
+                return
+
+
 class YouTubePlaylistDownloader:
     """Classe principale per il download delle playlist YouTube"""
 
-    def __init__(self, api_key: str):
+    PLAYLIST_ITEMS_URL = 'https://www.googleapis.com/youtube/v3/playlistItems'
+    VIDEOS_URL = 'https://www.googleapis.com/youtube/v3/videos'
+    PLAYLISTS_URL = 'https://www.googleapis.com/youtube/v3/playlists'
+    VIDEOS_BATCH_SIZE = 50  # Massimo di ID per richiesta videos.list
+    STAGE_QUEUE_FACTOR = 2  # Job in coda per thread negli stadi di transcodifica e tag
+    DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "youtube_playlist_downloader")
+    DEFAULT_COVER_CACHE = os.path.join(DEFAULT_CACHE_DIR, "covers")
+    DEFAULT_QUOTA_FILE = os.path.join(DEFAULT_CACHE_DIR, "quota.sqlite")
+    API_DAILY_QUOTA = 10000  # Unità giornaliere della YouTube Data API
+    QUOTA_EXCEEDED_REASONS = ('quotaExceeded', 'dailyLimitExceeded')
+    OUTPUT_FORMATS = ('mp3', 'native')
+    NATIVE_EXTENSIONS = ('.m4a', '.opus', '.ogg')  # Già taggabili così come sono
+    NATIVE_REMUX = {'opus': '.opus', 'vorbis': '.ogg'}  # Codec del webm → contenitore Ogg equivalente
+    STREAM_CHUNK_SIZE = 10 * 1024 * 1024  # Byte per richiesta Range (come http_chunk_size di yt-dlp)
+    STREAMABLE_PROTOCOLS = ('http', 'https')  # DASH e HLS restano sul percorso su file
+    ERROR_REPORT = 'download_errors.log'  # Errori completi dell'ultima run, nella cartella di download
+    # Classi di errore: i permanenti non vengono ritentati e le sincronizzazioni successive li saltano
+    # per `recheck_unavailable` giorni, temporanei e throttling tornano in download dopo un backoff,
+    # gli altri (es. un formato richiesto non disponibile, spesso momentaneo) falliscono come sempre
+    PERMANENT, TRANSIENT, THROTTLED, UNKNOWN = 'permanent', 'transient', 'throttled', 'unknown'
+    PERMANENT_ERRORS = (
+        'Private video', 'This video is private', 'Video unavailable', 'This video has been removed',
+        'This video is no longer available', 'account associated with this video has been terminated',
+        'Sign in to confirm your age', 'members-only', "channel's members", 'available in your country',
+        'copyright claim', 'Unsupported URL', 'Incomplete YouTube ID',
+    )
+    TRANSIENT_ERRORS = (
+        'timed out', 'Connection reset', 'Connection aborted', 'Connection refused', 'Remote end closed connection',
+        'Temporary failure in name resolution', 'Unable to download webpage', 'IncompleteRead',
+        'Giving up after', 'HTTP Error 500', 'HTTP Error 502', 'HTTP Error 503', 'HTTP Error 504',
+        'HTTP Error 403',  # URL dei formati scaduto: il nuovo tentativo li risolve di nuovo
+    )
+    TRANSIENT_TYPES = ('TransportError', 'IncompleteRead', 'SSLError', 'ProxyError', 'ContentTooShortError')
+    RETRY_DELAY = (5.0, 120.0)  # Attesa iniziale e massima tra i tentativi di un video (secondi)
+    API_STAGES = {'playlistItems': 'page_fetch', 'videos': 'videos_metadata', 'playlists': 'playlist_info'}
+
+    def __init__(self, api_key: str, max_workers: int = 4, prefetch: int = 0, batch_metadata: bool = True,
+                 region: Optional[str] = None, transcode_workers: Optional[int] = None, tag_workers: int = 2,
+                 report_interval: float = 30.0, in_memory: bool = False,
+                 cover_cache_dir: Optional[str] = DEFAULT_COVER_CACHE, http2: bool = False,
+                 api_quota: int = API_DAILY_QUOTA, quota_file: Optional[str] = DEFAULT_QUOTA_FILE,
+                 output_format: str = 'mp3', stream_transcode: bool = False, bandwidth: Optional[float] = None,
+                 api_base_url: Optional[str] = None, ydl_class: Optional[type] = None,
+                 rate_limits: Optional[Dict[str, Tuple[float, float]]] = None, events_file: Optional[str] = None,
+                 metrics_file: Optional[str] = None, metrics_port: Optional[int] = None, max_retries: int = 3,
+                 recheck_unavailable: Optional[float] = 30.0):
+        if output_format not in self.OUTPUT_FORMATS:
+            raise ValueError(f"Formato di output non valido: {output_format} (ammessi: {', '.join(self.OUTPUT_FORMATS)})")
         self.api_key = api_key
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        self.output_format = output_format  # 'mp3' (ricodifica 320 kbps) o 'native' (codec originale)
+        self.stream_transcode = stream_transcode  # Byte scaricati passati a ffmpeg senza file intermedio
+        self.bandwidth = bandwidth  # Byte/s totali per i download, divisi tra i worker
+        # Giorni dopo cui un video non disponibile viene ricontrollato dalle sincronizzazioni (None: mai)
+        self.recheck_unavailable = recheck_unavailable
+        # Impostati da PlaylistBatch quando più playlist condividono lo stesso downloader
+        self.shared_files: Optional[SharedFiles] = None
+        self.download_slots: Optional[threading.Semaphore] = None
+        # Impostati da QueueWorker quando più processi si dividono la stessa coda
+        self.work_queue: Optional[WorkQueue] = None
+        self.worker_id: Optional[str] = None
+        self._ydl_class = ydl_class  # Sostituibile (es. estrattore finto nei benchmark)
+        # Eventi strutturati (JSON lines) e metriche Prometheus: su file e/o via HTTP
+        self.events = EventStream(events_file)
+        self.metrics_file = metrics_file
+        if metrics_port:
+            try:
+                self.events.serve(metrics_port)
+            except OSError as e:
+                print(f"{Colors.WARNING}⚠️  Endpoint delle metriche non disponibile ({e}){Colors.ENDC}")
+        if api_base_url:
+            # Server compatibile con la Data API (es. un sostituto locale per i test)
+            base = api_base_url.rstrip('/')
+            self.PLAYLIST_ITEMS_URL = f'{base}/playlistItems'
+            self.VIDEOS_URL = f'{base}/videos'
+            self.PLAYLISTS_URL = f'{base}/playlists'
+        self._runs = 0  # download_audio in corso, per chiudere le risorse solo alla fine dell'ultimo
+        self._runs_lock = threading.Lock()
+        self.max_workers = max(1, max_workers)  # Video scaricati in parallelo
+        self.transcode_workers = max(1, transcode_workers or os.cpu_count() or 1)  # Un ffmpeg per core
+        self.tag_workers = max(1, tag_workers)
+        self.report_interval = report_interval  # Secondi tra un report delle code e l'altro
+        self.in_memory = in_memory  # Info e copertina in memoria, senza file accessori su disco
+        self.cover_processor = CoverArtProcessor(cover_cache_dir)
+        self.prefetch = max(0, prefetch)  # Video successivi da risolvere in anticipo
+        self.max_retries = max(0, max_retries)  # Nuovi tentativi per errori temporanei e throttling
+        self.batch_metadata = batch_metadata  # Metadati via videos.list a blocchi di 50
+        self.region = region.upper() if region else None  # Paese per scartare i video bloccati
+        self._active_jobs = {}  # video_id → VideoJob in download, per gli hook di yt-dlp
+        self._active_jobs_lock = threading.Lock()
+        # Un solo client HTTP per API e thumbnail: il pool copre tutti i thread che lo usano
+        # (download con prefetch, tag e il caricamento della playlist)
+        # Un limitatore condiviso da tutti i thread sostituisce le pause fisse
+        self.rate_limiter = RateLimiter(rate_limits)
+        self.quota = QuotaTracker(api_quota, state_file=quota_file, api_key=api_key)
+        self.http = HttpClient(pool_size=self.max_workers + self.prefetch + self.tag_workers + 2, http2=http2,
+                               rate_limiter=self.rate_limiter, events=self.events)
+
+    @property
+    def ydl_class(self) -> type:
+        """Classe YoutubeDL da usare; yt-dlp viene importato al primo download"""
+        if self._ydl_class is None:
+            import yt_dlp
+            self._ydl_class = yt_dlp.YoutubeDL
+        return self._ydl_class
 
     def print_banner(self):
         os.system('cls' if os.name == 'nt' else 'clear')
@@ -81,11 +1788,70 @@ class YouTubePlaylistDownloader:
                 return match.group(1)
         return None
 
-    def extract_playlist_videos(self, playlist_id: str) -> List[str]:
-        """Estrae tutti i video dalla playlist"""
-        print(f"\n{Colors.OKBLUE}🔍 Ricerca video nella playlist...{Colors.ENDC}")
+    def get_video_id(self, video_link: str) -> Optional[str]:
+        """Estrae l'ID del video dal link YouTube"""
+        match = re.search(r"(?:v=|youtu\.be\/|shorts\/)([a-zA-Z0-9_-]{11})", video_link)
+        return match.group(1) if match else None
+
+    def api_get(self, url: str, params: dict, units: int = 1) -> dict:
+        """Chiamata alla Data API: consuma quota, rispetta il rate limit e controlla gli errori
+
+        La quota viene addebitata a ogni invio: anche le richieste ripetute dopo un throttling
+        contano per YouTube.
+        """
+        stage = self.API_STAGES.get(url.rstrip('/').rsplit('/', 1)[-1], 'api')
+        with self.events.timer(stage) as span:
+            try:
+                response = self.http.get(url, params=params, timeout=10, budget='api',
+                                         on_attempt=lambda: self.quota.consume(units))
+            except HttpStatusError as e:
+                if e.status_code == 403 and api_error_reason(e.response) in self.QUOTA_EXCEEDED_REASONS:
+                    raise QuotaExceededError("quota giornaliera della Data API esaurita") from e
+                raise
+            span['bytes'] = len(response.content)
+            return response.json()
+
+    def get_playlist_size(self, playlist_id: str) -> int:
+        """Restituisce il numero di video nella playlist con una sola richiesta API"""
+        params = {
+            'part': 'id',
+            'playlistId': playlist_id,
+            'maxResults': 1,
+            'key': self.api_key
+        }
+
+        try:
+            data = self.api_get(self.PLAYLIST_ITEMS_URL, params)
+        except QuotaExceededError as e:
+            print(f"\n{Colors.FAIL}⛔ {e}{Colors.ENDC}")
+            return 0
+        except requests.exceptions.RequestException as e:
+            print(f"\n{Colors.FAIL}❌ Errore di connessione: {e}{Colors.ENDC}")
+            return 0
+
+        if 'error' in data:
+            print(f"\n{Colors.FAIL}❌ Errore API: {data['error']['message']}{Colors.ENDC}")
+            return 0
+        return data.get('pageInfo', {}).get('totalResults', 0)
+
+    def get_playlist_title(self, playlist_id: str) -> Optional[str]:
+        """Restituisce il titolo della playlist (None se non disponibile)"""
+        params = {
+            'part': 'snippet',
+            'id': playlist_id,
+            'key': self.api_key
+        }
 
-        base_url = 'https://www.googleapis.com/youtube/v3/playlistItems'
+        try:
+            data = self.api_get(self.PLAYLISTS_URL, params)
+        except (QuotaExceededError, requests.exceptions.RequestException):
+            return None
+
+        items = data.get('items') or []
+        return items[0]['snippet'].get('title') if items else None
+
+    def iter_playlist_videos(self, playlist_id: str, verbose: bool = False) -> Iterator[str]:
+        """Restituisce i link dei video della playlist pagina per pagina, man mano che arrivano"""
         params = {
             'part': 'snippet',
             'playlistId': playlist_id,
@@ -93,37 +1859,149 @@ class YouTubePlaylistDownloader:
             'key': self.api_key
         }
 
-        video_links = []
         page_count = 0
-
-        try:
-            while True:
+        while True:
+            if verbose:
                 print(f"\r{Colors.OKCYAN}📄 Caricamento pagina {page_count + 1}...{Colors.ENDC}", end='', flush=True)
 
-                response = self.session.get(base_url, params=params, timeout=10)
-                response.raise_for_status()
-                data = response.json()
+            data = self.api_get(self.PLAYLIST_ITEMS_URL, params)
 
-                # Controllo errori API
-                if 'error' in data:
-                    raise Exception(f"Errore API: {data['error']['message']}")
+            # Controllo errori API
+            if 'error' in data:
+                raise Exception(f"Errore API: {data['error']['message']}")
 
-                for item in data.get('items', []):
-                    snippet = item.get('snippet', {})
-                    resource = snippet.get('resourceId', {})
-                    video_id = resource.get('videoId')
-                    if video_id:
-                        video_links.append(f'https://www.youtube.com/watch?v={video_id}')
+            for item in data.get('items', []):
+                snippet = item.get('snippet', {})
+                resource = snippet.get('resourceId', {})
+                video_id = resource.get('videoId')
+                if video_id:
+                    yield f'https://www.youtube.com/watch?v={video_id}'
 
-                page_count += 1
+            page_count += 1
 
-                # Controllo paginazione
-                if 'nextPageToken' in data:
-                    params['pageToken'] = data['nextPageToken']
-                    time.sleep(0.1)  # Rate limiting
-                else:
+            # Controllo paginazione
+            if 'nextPageToken' in data:
+                params['pageToken'] = data['nextPageToken']
+            else:
+                break
+
+    def fetch_videos_metadata(self, video_ids: List[str]) -> Tuple[Dict[str, dict], Dict[str, str]]:
+        """Recupera i metadati di un blocco di video (max 50) con una sola richiesta videos.list
+
+        Restituisce i metadati dei video scaricabili (con le stesse chiavi di yt-dlp) e, per quelli
+        da scartare, il motivo (privato, rimosso, bloccato nella regione).
+        """
+        params = {
+            'part': 'snippet,contentDetails,status',
+            'id': ','.join(video_ids),
+            'maxResults': self.VIDEOS_BATCH_SIZE,
+            'key': self.api_key
+        }
+
+        data = self.api_get(self.VIDEOS_URL, params)
+
+        if 'error' in data:
+            raise Exception(f"Errore API: {data['error']['message']}")
+
+        available = {}
+        unavailable = {}
+        for item in data.get('items', []):
+            video_id = item.get('id')
+            snippet = item.get('snippet', {})
+            details = item.get('contentDetails', {})
+            status = item.get('status', {})
+
+            # Scarta i video che fallirebbero comunque
+            restriction = details.get('regionRestriction', {})
+            if status.get('privacyStatus') == 'private':
+                unavailable[video_id] = 'video privato'
+                continue
+            if status.get('uploadStatus') in ('deleted', 'failed', 'rejected'):
+                unavailable[video_id] = 'video rimosso'
+                continue
+            if self.region and (self.region in restriction.get('blocked', []) or
+                                ('allowed' in restriction and self.region not in restriction['allowed'])):
+                unavailable[video_id] = f'bloccato in {self.region}'
+                continue
+
+            # Miglior thumbnail disponibile
+            thumbnails = snippet.get('thumbnails', {})
+            thumbnail = None
+            for quality in ('maxres', 'standard', 'high', 'medium', 'default'):
+                if quality in thumbnails:
+                    thumbnail = thumbnails[quality].get('url')
                     break
 
+            available[video_id] = {
+                'id': video_id,
+                'title': snippet.get('title', 'Unknown Title'),
+                'uploader': snippet.get('channelTitle', 'Unknown Artist'),
+                'upload_date': snippet.get('publishedAt', '')[:10].replace('-', ''),
+                'duration': self.parse_iso_duration(details.get('duration', '')),
+                'description': snippet.get('description', ''),
+                'thumbnail': thumbnail,
+            }
+
+        # I video privati o eliminati non vengono restituiti affatto
+        for video_id in video_ids:
+            if video_id not in available and video_id not in unavailable:
+                unavailable[video_id] = 'video privato o eliminato'
+
+        return available, unavailable
+
+    def parse_iso_duration(self, duration: str) -> int:
+        """Converte una durata ISO 8601 (es. PT1H2M3S) in secondi"""
+        match = re.match(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$", duration)
+        if not match:
+            return 0
+        days, hours, minutes, seconds = (int(value or 0) for value in match.groups())
+        return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+    def iter_with_metadata(self, urls: Iterable[str], archive: Optional[DownloadArchive] = None,
+                           folder: Optional[str] = None) -> Iterator[Tuple[str, Optional[dict]]]:
+        """Associa ai video i metadati recuperati a blocchi, scartando quelli non scaricabili
+
+        `folder` è la cartella della run a cui riferire gli eventi (video saltati, errori).
+        """
+        batch = []
+        for url in urls:
+            batch.append(url)
+            if len(batch) >= self.VIDEOS_BATCH_SIZE:
+                yield from self._metadata_batch(batch, archive, folder)
+                batch = []
+        if batch:
+            yield from self._metadata_batch(batch, archive, folder)
+
+    def _metadata_batch(self, urls: List[str], archive: Optional[DownloadArchive],
+                        folder: Optional[str] = None) -> Iterator[Tuple[str, Optional[dict]]]:
+        """Elabora un blocco di video per `iter_with_metadata`"""
+        ids = {url: self.get_video_id(url) for url in urls}
+
+        try:
+            available, unavailable = self.fetch_videos_metadata([vid for vid in ids.values() if vid])
+        except Exception as e:
+            # Senza metadati i video vengono comunque passati a yt-dlp
+            self.events.emit('metadata_failed', folder=folder, videos=len(urls), error=f"{type(e).__name__}: {e}")
+            for url in urls:
+                yield url, None
+            return
+
+        for url, video_id in ids.items():
+            if video_id in unavailable:
+                self.events.emit('video_unavailable', folder=folder, video_id=video_id, url=url,
+                                 reason=unavailable[video_id])
+                if archive:
+                    archive.record(video_id, url, 'unavailable', error=unavailable[video_id])
+                continue
+            yield url, available.get(video_id)
+
+    def extract_playlist_videos(self, playlist_id: str) -> List[str]:
+        """Estrae tutti i video dalla playlist"""
+        print(f"\n{Colors.OKBLUE}🔍 Ricerca video nella playlist...{Colors.ENDC}")
+
+        try:
+            video_links = list(self.iter_playlist_videos(playlist_id, verbose=True))
+
         except requests.exceptions.RequestException as e:
             print(f"\n{Colors.FAIL}❌ Errore di connessione: {e}{Colors.ENDC}")
             return []
@@ -145,33 +2023,96 @@ class YouTubePlaylistDownloader:
             print(f"{Colors.FAIL}❌ Impossibile creare la cartella: {e}{Colors.ENDC}")
             return False
 
-    def download_audio(self, urls: List[str], download_folder: str):
-        """Scarica l'audio dai video YouTube"""
+    def download_audio(self, urls: Iterable[str], download_folder: str, max_workers: Optional[int] = None,
+                       prefetch: Optional[int] = None, sync: bool = False, total: Optional[int] = None,
+                       resume: bool = True, source: Optional[str] = None, with_metadata: bool = False):
+        """Scarica l'audio dai video YouTube
+
+        `urls` può essere una lista oppure un iteratore (es. `iter_playlist_videos`): in quel caso
+        i download partono appena arriva la prima pagina mentre le successive si caricano in
+        background. `total` è una stima opzionale del numero di video per la barra di progresso.
+        Con `resume` una run interrotta riprende dal diario; `source` (es. l'ID della playlist)
+        permette di riusare l'elenco già caricato invece di richiederlo di nuovo all'API.
+        Con `with_metadata` gli elementi di `urls` sono già coppie (url, metadati).
+        """
         if not self.create_download_folder(download_folder):
-            return
+            return None
 
-        # Configurazione yt-dlp migliorata con metadati
+        archive = DownloadArchive(download_folder)
+        journal = JobJournal(download_folder)
+        finished = False
+        with self._runs_lock:
+            self._runs += 1
+        try:
+            listed = with_metadata
+            if resume and journal.exists():
+                journal.load()
+                saved = journal.listed_entries(source)
+                print(f"\n{Colors.OKCYAN}🔁 Ripresa della run interrotta: {len(journal.state)} video "
+                      f"nel diario{Colors.ENDC}")
+                if saved is not None:
+                    # Elenco e metadati già nel diario: nessuna chiamata all'API
+                    urls, total, listed = saved, len(saved), True
+            elif not resume:
+                journal.close(finished=True)  # Riparte da zero
+
+            streaming = not isinstance(urls, (list, tuple))
+            if sync:
+                # Sincronizzazione: solo video nuovi o falliti in precedenza (non quelli non disponibili)
+                completed = archive.completed_ids() | archive.unavailable_ids(self.recheck_unavailable)
+                if streaming:
+                    print(f"\n{Colors.OKCYAN}🔄 Sincronizzazione: {len(completed)} video già presenti "
+                          f"nell'archivio verranno saltati{Colors.ENDC}")
+                    urls = (url for url in urls if self.get_video_id(url) not in completed)
+                    total = None  # Il numero di video da scaricare sarà noto solo alla fine
+                else:
+                    pending = [entry for entry in urls
+                               if self.get_video_id(entry[0] if listed else entry) not in completed]
+                    print(f"\n{Colors.OKCYAN}🔄 Sincronizzazione: {len(urls) - len(pending)} già scaricati "
+                          f"o non disponibili, {len(pending)} da scaricare{Colors.ENDC}")
+                    urls = pending
+
+            if not streaming:
+                if not urls:
+                    print(f"{Colors.OKGREEN}✅ Playlist già sincronizzata, niente da scaricare!{Colors.ENDC}")
+                    finished = True
+                    return {'successful': 0, 'failed': [], 'resumed': 0, 'finished': True}
+                total = len(urls)
+
+            results = self._run_downloads(urls, download_folder, archive, journal, max_workers, prefetch,
+                                          total, source, listed)
+            finished = results['finished']
+            return results
+        finally:
+            archive.close()
+            journal.close(finished=finished)
+            with self._runs_lock:
+                self._runs -= 1
+                last_run = self._runs == 0
+            if last_run:
+                self.cover_processor.shutdown()
+            self.write_metrics()
+
+    def _run_downloads(self, urls: Iterable, download_folder: str, archive: DownloadArchive,
+                       journal: JobJournal, max_workers: Optional[int], prefetch: Optional[int],
+                       total: Optional[int], source: Optional[str] = None, listed: bool = False) -> dict:
+        """Esegue la pipeline download → transcodifica → tag sui video indicati
+
+        Restituisce i risultati; `finished` è True se tutti i video sono stati elaborati.
+        """
+        # Configurazione yt-dlp: solo download, la transcodifica è uno stadio separato
         ydl_opts = {
-            'format': 'bestaudio[ext=m4a]/bestaudio/best',
+            'format': ('bestaudio[ext=m4a]/bestaudio[acodec=opus]/bestaudio/best' if self.output_format == 'native'
+                       else 'bestaudio[ext=m4a]/bestaudio/best'),
             'outtmpl': os.path.join(download_folder, '%(title)s.%(ext)s'),
-            'postprocessors': [
-                {
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '320',
-                },
-                {
-                    'key': 'FFmpegMetadata',
-                    'add_metadata': True,
-                }
-            ],
             'noplaylist': True,
-            'writethumbnail': True,  # Scarica thumbnail
-            'writeinfojson': True,  # Scarica info per metadati
-            'ignoreerrors': True,
+            'writethumbnail': not self.in_memory,  # Scarica thumbnail
+            'writeinfojson': not self.in_memory,  # Scarica info per metadati
+            'ignoreerrors': False,  # Gli errori arrivano allo stadio (e al rate limiter)
+            'continuedl': True,  # Riprende i file .part lasciati da una run interrotta
             'no_warnings': True,
             'quiet': True,
-            'extractaudio': True,
+            'logger': YdlEventLogger(self.events),  # Tentativi ripetuti di yt-dlp come eventi `retry`
         }
 
         # Aggiungi ffmpeg path se specificato
@@ -179,43 +2120,760 @@ class YouTubePlaylistDownloader:
         if ffmpeg_path:
             ydl_opts['ffmpeg_location'] = ffmpeg_path
 
+        # Banda totale divisa tra i download contemporanei possibili
+        if self.bandwidth:
+            ydl_opts['ratelimit'] = self.bandwidth / self.max_workers
+
+        workers = max(1, min(max_workers or self.max_workers, total or sys.maxsize))
+        prefetch = self.prefetch if prefetch is None else max(0, prefetch)
+
         print(f"\n{Colors.HEADER}🎵 INIZIO DOWNLOAD{Colors.ENDC}")
         print(f"{Colors.OKCYAN}📂 Cartella: {download_folder}{Colors.ENDC}")
-        print(f"{Colors.OKCYAN}🎯 Video da scaricare: {len(urls)}{Colors.ENDC}\n")
+        print(f"{Colors.OKCYAN}🎯 Video da scaricare: {total if total else 'in caricamento...'}{Colors.ENDC}")
+        print(f"{Colors.OKCYAN}⚙️  Pipeline: {workers} download, {self.transcode_workers} transcodifiche, "
+              f"{self.tag_workers} tag{Colors.ENDC}")
+        if prefetch:
+            print(f"{Colors.OKCYAN}🔮 Video risolti in anticipo: {prefetch}{Colors.ENDC}")
+        print()
+
+        stop_event = threading.Event()
+        prefetch_pool = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix='prefetch') if prefetch else None
+        prefetch_ydls = []
+
+        # Output per l'utente ricavato dagli eventi della run, e risultati condivisi tra gli stadi
+        renderer = ConsoleRenderer(download_folder, total)
+        self.events.subscribe(renderer)
+        self.events.emit('run_started', folder=download_folder, source=source, total=total, workers=workers,
+                         prefetch=prefetch, format=self.output_format, stream=self.stream_transcode)
+        results = {'successful': 0, 'failed': [], 'errors': [], 'resumed': 0, 'skipped': 0, 'listing_complete': False,
+                   'time_to_first_file': None}
+        results_lock = threading.Lock()
+
+        def fetched(job: VideoJob):
+            retries.finished(job)
+            journal.record(job.video_id, 'fetched', source_file=job.source_file,
+                           thumbnail_file=job.thumbnail_file, infojson_file=job.infojson_file,
+                           info=JobJournal.info_subset(job.info))
+            transcode_stage.put(job)
+
+        def transcoded(job: VideoJob):
+            journal.record(job.video_id, 'transcoded', audio_file=job.audio_file)
+            tag_stage.put(job)
+
+        def skip(job: VideoJob):
+            # Già completato nella run interrotta
+            with results_lock:
+                results['resumed'] += 1
+            self.events.emit('video_skipped', folder=download_folder, index=job.index, video_id=job.video_id)
+
+        def complete(job: VideoJob, linked: bool = False):
+            if self.work_queue:
+                audio_file = self.work_queue.finalize(job.video_id, job.audio_file, self.worker_id)
+                if audio_file is None:
+                    # Claim perso: il video è passato a un altro worker, che lo completa lui
+                    with results_lock:
+                        results['skipped'] += 1
+                    self.events.emit('video_skipped', folder=download_folder, index=job.index, video_id=job.video_id,
+                                     reason='claim_lost')
+                    return
+                job.audio_file = audio_file
+            journal.record(job.video_id, 'tagged', audio_file=job.audio_file)
+            archive.record(job.video_id, job.url, 'done', title=job.info.get('title'),
+                           filepath=job.audio_file, tagged=job.tagged)
+            if self.shared_files:
+                self.shared_files.resolve(job.video_id, job.audio_file)
+            with results_lock:
+                results['successful'] += 1
+                if results['time_to_first_file'] is None:
+                    results['time_to_first_file'] = time.monotonic() - start_time
+            self.events.emit('video_done', folder=download_folder, index=job.index, video_id=job.video_id,
+                             title=(job.info or {}).get('title'), file=job.audio_file, tagged=job.tagged,
+                             linked=linked)
+
+        def fail(job: VideoJob, stage: str, error: Exception):
+            failure = self.classify_error(error)
+            if stage == download_stage.name:
+                if (failure in (self.TRANSIENT, self.THROTTLED) and job.attempts < self.max_retries
+                        and not stop_event.is_set()):
+                    # Nuovo tentativo dopo un backoff, senza occupare un worker nell'attesa
+                    job.attempts += 1
+                    job.prefetched = None  # Formati e URL vengono risolti di nuovo
+                    delay = retries.backoff(job.attempts)
+                    self.events.emit('retry', kind='video', folder=download_folder, index=job.index,
+                                     video_id=job.video_id, failure=failure, attempt=job.attempts,
+                                     delay=round(delay, 1), reason=f"{type(error).__name__}: {error}")
+                    retries.schedule(job, delay)
+                    return
+                retries.finished(job)
+            if self.shared_files:
+                self.shared_files.resolve(job.video_id, None)
+            if self.work_queue:
+                self.work_queue.fail(job.video_id, self.worker_id, f"{stage}: {error}",
+                                     permanent=failure == self.PERMANENT)
+            journal.record(job.video_id, 'failed', error=f"{stage}: {error}")
+            # I video non disponibili restano nell'archivio: le sincronizzazioni successive li saltano
+            archive.record(job.video_id, job.url, 'unavailable' if failure == self.PERMANENT else 'failed',
+                           error=f"{stage}: {error}")
+            # Messaggio completo: viene accorciato solo sulla console
+            title = (job.info or job.metadata or {}).get('title')
+            details = {'video_id': job.video_id, 'url': job.url, 'title': title, 'stage': stage,
+                       'failure': failure, 'attempts': job.attempts + 1,
+                       'error_type': type(error).__name__, 'error': str(error)}
+            with results_lock:
+                results['failed'].append((job.url, str(error)))
+                results['errors'].append({
+                    **details,
+                    'traceback': ''.join(traceback.format_exception(type(error), error, error.__traceback__)),
+                })
+            self.events.emit('video_failed', folder=download_folder, index=job.index, **details)
+
+        # Stadi della pipeline, collegati da code limitate: quando uno stadio è saturo
+        # quello precedente si ferma invece di accumulare lavoro in memoria
+        tag_stage = PipelineStage(
+            'tag', self.tag_workers, self._tag_stage,
+            queue_size=self.tag_workers * self.STAGE_QUEUE_FACTOR,
+            on_done=complete, on_error=fail, stop_event=stop_event,
+        )
+        transcode_stage = PipelineStage(
+            'transcodifica', self.transcode_workers,
+            lambda job, _: self._transcode_stage(job, ffmpeg_path),
+            queue_size=self.transcode_workers * self.STAGE_QUEUE_FACTOR,
+            on_done=transcoded, on_error=fail, stop_event=stop_event,
+        )
+        # Coda di download sempre limitata; se si risolve in anticipo è lunga `prefetch`, così
+        # vengono preparati solo i prossimi `prefetch` video
+        download_stage = PipelineStage(
+            'download', workers, self._download_stage,
+            queue_size=prefetch or workers * self.STAGE_QUEUE_FACTOR,  # Mai 0: sarebbe una coda illimitata
+            on_done=fetched, on_error=fail, stop_event=stop_event,
+            worker_context=lambda: self._create_ydl(ydl_opts),  # Un'istanza YoutubeDL per thread
+        )
+        stages = [download_stage, transcode_stage, tag_stage]
+        retries = RetryQueue(download_stage.put, stop_event, *self.RETRY_DELAY)
+
+        feeder = threading.Thread(
+            target=self._feed_jobs,
+            args=(stages, urls, download_folder, ydl_opts, prefetch_pool, prefetch_ydls, archive, journal,
+                  stop_event, skip, complete, results, source, listed),
+            name="download-feeder",
+            daemon=True,
+        )
+        monitor_stop = threading.Event()
+        monitor = threading.Thread(
+            target=self._monitor_pipeline,
+            args=(stages, monitor_stop, download_folder),
+            name="pipeline-monitor",
+            daemon=True,
+        )
+
+        start_time = time.monotonic()
+        for stage in stages:
+            stage.start()
+        feeder.start()
+        monitor.start()
 
-        # Barra di progresso
-        progress = ProgressBar(len(urls))
-        successful_downloads = 0
-        failed_downloads = []
+        try:
+            # Chiusura ordinata: ogni stadio termina dopo aver svuotato la propria coda
+            self._wait(feeder)
+            for stage in stages:
+                if stage is download_stage:
+                    retries.drain(download_stage)  # Download in corso e nuovi tentativi prima della chiusura
+                stage.close()
+                self._wait(stage)
+        except KeyboardInterrupt:
+            stop_event.set()  # Gli stadi terminano dopo il video in corso
+            raise
+        finally:
+            retries.close()
+            monitor_stop.set()
+            self.events.unsubscribe(renderer)
+            if prefetch_pool:
+                prefetch_pool.shutdown(wait=False, cancel_futures=True)
+                for ydl in prefetch_ydls:
+                    ydl.close()
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            for i, url in enumerate(urls, 1):
-                try:
-                    # Ottieni info del video
-                    info = ydl.extract_info(url, download=False)
-                    title = info.get('title', 'Titolo sconosciuto')[:50]
+        # Riepilogo finale
+        results['finished'] = results['listing_complete'] and not stop_event.is_set()
+        results['elapsed'] = time.monotonic() - start_time
+        results['stage_durations'] = {stage.name: stage.durations for stage in stages}
+        results['retries'] = retries.scheduled
+        results['unavailable'] = sum(error['failure'] == self.PERMANENT for error in results['errors'])
+        self.events.emit('run_finished', folder=download_folder, source=source, successful=results['successful'],
+                         failed=len(results['failed']), unavailable=results['unavailable'], retries=results['retries'],
+                         resumed=results['resumed'], finished=results['finished'], elapsed=round(results['elapsed'], 3),
+                         time_to_first_file=results['time_to_first_file'])
+        self.print_pipeline_stats(stages, results['elapsed'])
+        if results['resumed']:
+            print(f"{Colors.OKCYAN}🔁 Già completati nella run interrotta: {results['resumed']}{Colors.ENDC}")
+        if results['skipped']:
+            print(f"{Colors.WARNING}⏭️  Lasciati ad altri worker (lease scaduto): {results['skipped']}{Colors.ENDC}")
+        if results['retries']:
+            print(f"{Colors.OKCYAN}🔁 Nuovi tentativi dopo errori temporanei: {results['retries']}{Colors.ENDC}")
+        report = self.write_error_report(download_folder, results['errors'])
+        self.print_summary(results['successful'], results['failed'], download_folder, report,
+                           unavailable=results['unavailable'])
+        return results
+
+    def _create_ydl(self, ydl_opts: dict) -> 'yt_dlp.YoutubeDL':
+        """Crea un'istanza YoutubeDL con gli hook che registrano i percorsi dei file prodotti"""
+        ydl = self.ydl_class(ydl_opts)
+        ydl.add_progress_hook(self._progress_hook)
+        ydl.add_postprocessor_hook(self._postprocessor_hook)
+        if self.in_memory:
+            ydl.add_post_processor(in_memory_handoff_pp(self, ydl), when='post_process')
+        return ydl
+
+    def _job_for_hook(self, hook_data: dict) -> Optional[VideoJob]:
+        """Trova il job a cui si riferisce un evento di yt-dlp"""
+        video_id = (hook_data.get('info_dict') or {}).get('id')
+        with self._active_jobs_lock:
+            return self._active_jobs.get(video_id)
+
+    def _progress_hook(self, d: dict):
+        """Hook di yt-dlp: registra il file scaricato al termine del download"""
+        if d.get('status') == 'finished':
+            job = self._job_for_hook(d)
+            if job and d.get('filename'):
+                job.source_file = d['filename']
+
+    def _postprocessor_hook(self, d: dict):
+        """Hook di yt-dlp: registra il file finale prodotto dai post-processor"""
+        if d.get('status') == 'finished':
+            job = self._job_for_hook(d)
+            filepath = (d.get('info_dict') or {}).get('filepath')
+            if job and filepath:
+                job.source_file = filepath
+
+    def _wait(self, worker):
+        """Attende un thread o uno stadio restando reattivi a Ctrl+C"""
+        while worker.is_alive():
+            worker.join(0.5)
+
+    def _feed_jobs(self, stages: List[PipelineStage], urls: Iterable, download_folder: str,
+                   ydl_opts: dict, prefetch_pool: Optional[ThreadPoolExecutor], prefetch_ydls: List,
+                   archive: DownloadArchive, journal: JobJournal, stop_event: threading.Event, on_skip: Callable[[VideoJob], None],
+                   on_shared: Callable[..., None], results: dict, source: Optional[str] = None,
+                   listed: bool = False):
+        """Inserisce i video nella pipeline, avviando la risoluzione anticipata se attiva
+
+        I video presenti nel diario ripartono dallo stadio successivo all'ultimo completato.
+        Con `listed` gli elementi sono già coppie (url, metadati) lette dal diario. Con un
+        batch di playlist, i video già elaborati da un'altra playlist vengono solo collegati.
+        """
+        download_stage, transcode_stage, tag_stage = stages
+        local = threading.local()
+        ydls_lock = threading.Lock()
+
+        def resolve(url: str) -> Optional[dict]:
+            # Ogni thread di prefetch usa una propria istanza YoutubeDL
+            if not hasattr(local, 'ydl'):
+                local.ydl = self.ydl_class(ydl_opts)
+                with ydls_lock:
+                    prefetch_ydls.append(local.ydl)
+            self.rate_limiter.acquire('media')
+            with self.events.timer('extract_info', video_id=self.get_video_id(url), prefetched=True):
+                return local.ydl.extract_info(url, download=False, process=False)
+
+        # Metadati a blocchi di 50: i video non scaricabili non arrivano ai worker
+        if listed:
+            entries = urls
+        elif self.batch_metadata:
+            entries = self.iter_with_metadata(urls, archive, download_folder)
+        else:
+            entries = ((url, None) for url in urls)
+
+        count = 0
+        duplicates: Dict[Future, List[VideoJob]] = {}
+        try:
+            for url, metadata in self._background_iter(entries, stop_event):
+                count += 1
+                job = VideoJob(count, url, self.get_video_id(url) or url, download_folder, metadata)
+                if not listed:
+                    # Elenco salvato senza fsync: se va perso basta ricaricarlo
+                    journal.record(job.video_id, 'listed', sync=False, url=url, metadata=metadata, source=source)
+
+                stage = self._resume_job(job, journal.state.get(job.video_id))
+                if stage == 'tagged':
+                    if self.shared_files:
+                        self.shared_files.add(job.video_id, job.audio_file)
+                    on_skip(job)
+                    continue
+                if self.shared_files:
+                    shared = self.shared_files.claim(job.video_id)
+                    if shared is not None and not stage:
+                        duplicates.setdefault(shared, []).append(job)  # Scaricato da un'altra playlist
+                        continue
+                if stage == 'transcoded':
+                    accepted = tag_stage.put(job)
+                elif stage == 'fetched':
+                    accepted = transcode_stage.put(job)
+                else:
+                    if prefetch_pool:
+                        job.prefetched = prefetch_pool.submit(resolve, url)
+                    accepted = download_stage.put(job)
+                if not accepted:
+                    if self.shared_files:
+                        self.shared_files.resolve(job.video_id, None)
+                    return
+            journal.record(None, 'listing_complete', source=source)
+            results['listing_complete'] = True
+        except QuotaExceededError as e:
+            # Stop pulito: i video già in coda vengono comunque completati
+            print(f"\n{Colors.FAIL}⛔ Caricamento playlist interrotto: {e}{Colors.ENDC}")
+        except requests.exceptions.RequestException as e:
+            print(f"\n{Colors.FAIL}❌ Errore di connessione: {e}{Colors.ENDC}")
+        except Exception as e:
+            print(f"\n{Colors.FAIL}❌ Errore durante l'estrazione: {e}{Colors.ENDC}")
 
-                    print(f"\n{Colors.OKBLUE}⬇️  [{i}/{len(urls)}] {title}...{Colors.ENDC}")
+        # Ora il numero di video è definitivo
+        self.events.emit('listing_done', folder=download_folder, source=source, total=count,
+                         complete=results['listing_complete'])
+
+        # Video condivisi: collegati appena l'altra playlist li completa
+        for shared in as_completed(duplicates):
+            path = shared.result()
+            for job in duplicates[shared]:
+                if path and os.path.exists(path):
+                    job.audio_file = self.shared_files.place(path, download_folder)
+                    job.info = job.metadata or {'title': os.path.splitext(os.path.basename(path))[0]}
+                    job.tagged = True
+                    on_shared(job, linked=True)
+                elif not download_stage.put(job):  # Non riuscito altrove: si riprova qui
+                    return
+
+    def _resume_job(self, job: VideoJob, state: Optional[dict]) -> Optional[str]:
+        """Ripristina nel job i file prodotti in una run precedente
+
+        Restituisce l'ultimo stadio completato i cui file sono ancora presenti su disco.
+        """
+        if not state or state.get('stage') in (None, 'listed'):
+            return None
+
+        audio_file = state.get('audio_file')
+        source_file = state.get('source_file')
+        job.info = state.get('info') or job.metadata or {}
+        if state['stage'] in ('transcoded', 'tagged') and audio_file and os.path.exists(audio_file):
+            job.audio_file = audio_file
+            job.thumbnail_file = state.get('thumbnail_file')
+            job.infojson_file = state.get('infojson_file')
+            return state['stage']
+        if source_file and os.path.exists(source_file):
+            job.source_file = source_file
+            job.thumbnail_file = state.get('thumbnail_file')
+            job.infojson_file = state.get('infojson_file')
+            return 'fetched'
+        return None  # File spariti: si riparte dal download
+
+    def _background_iter(self, items: Iterable, stop_event: threading.Event) -> Iterator:
+        """Consuma un iteratore in un thread separato, così il caricamento (es. pagine API)
+        prosegue anche mentre il consumatore è bloccato in attesa dei worker"""
+        if isinstance(items, (list, tuple)):
+            yield from items
+            return
 
-                    # Download
-                    ydl.download([url])
+        buffer = queue.Queue()
+        done = object()
 
-                    # Aggiungi metadati personalizzati
-                    self.add_metadata_to_mp3(info, download_folder)
+        def produce():
+            try:
+                for item in items:
+                    if stop_event.is_set():
+                        break
+                    buffer.put(item)
+            except Exception as e:
+                buffer.put(e)  # Rilanciata al consumatore
+            buffer.put(done)
 
-                    successful_downloads += 1
-                    print(f"{Colors.OKGREEN}✅ Completato con metadati!{Colors.ENDC}")
+        threading.Thread(target=produce, name="playlist-producer", daemon=True).start()
 
-                except Exception as e:
-                    error_msg = str(e)[:100]
-                    failed_downloads.append((url, error_msg))
-                    print(f"{Colors.FAIL}❌ Errore: {error_msg}{Colors.ENDC}")
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _download_stage(self, job: VideoJob, ydl: 'yt_dlp.YoutubeDL'):
+        """Stadio di download (I/O): scarica l'audio sorgente con un'unica estrazione"""
+        # Info già risolte in anticipo (pagina, formati e firme)
+        raw_info = None
+        if job.prefetched is not None:
+            try:
+                raw_info = job.prefetched.result()
+            except Exception as e:
+                failure = self.classify_error(e)
+                if failure == self.PERMANENT:
+                    raise  # Privato, rimosso...: nessuna seconda estrazione né slot di download
+                if failure == self.THROTTLED:
+                    delay = self.rate_limiter.throttled('media')  # Rallenta anche le richieste successive
+                    self.events.emit('throttled', folder=job.download_folder, video_id=job.video_id,
+                                     budget='media', delay=round(delay, 1), prefetched=True)
+                raw_info = None  # Riprova con l'estrazione completa
+
+        title = (job.metadata or raw_info or {}).get('title') or job.url
+        self.events.emit('video_start', folder=job.download_folder, index=job.index, video_id=job.video_id,
+                         title=title)
+
+        # Estrazione e download in un solo passaggio; gli hook registrano i file prodotti
+        with self.download_slots or contextlib.nullcontext():  # Budget globale del batch
+            self._fetch_media(job, ydl, raw_info)
+
+    def _fetch_media(self, job: VideoJob, ydl: 'yt_dlp.YoutubeDL', raw_info: Optional[dict]):
+        """Scarica l'audio del job (in streaming verso ffmpeg oppure su file)"""
+        self.rate_limiter.acquire('media')
+        with self._active_jobs_lock:
+            self._active_jobs[job.video_id] = job
+        try:
+            # Estrazione (pagina, formati e firme) e download misurati separatamente
+            if not raw_info:
+                with self.events.timer('extract_info', video_id=job.video_id):
+                    raw_info = ydl.extract_info(job.url, download=False, process=False)
+            with self.events.timer('media_download', video_id=job.video_id) as span:
+                if self.stream_transcode and self.output_format == 'mp3' and self._stream_download(job, ydl, raw_info):
+                    span.update(streamed=True, bytes=job.media_bytes)
+                    self.rate_limiter.succeeded('media')
+                    return
+                info = ydl.process_ie_result(raw_info, download=True) if raw_info else None
+                source_file = job.source_file or (info and self._downloaded_filepath(info))
+                if source_file and os.path.exists(source_file):
+                    job.media_bytes = os.path.getsize(source_file)
+                    span['bytes'] = job.media_bytes
+        except Exception as e:
+            if self.is_throttle_error(e):
+                delay = self.rate_limiter.throttled('media')
+                self.events.emit('throttled', folder=job.download_folder, video_id=job.video_id, budget='media',
+                                 delay=round(delay, 1))
+            raise
+        finally:
+            with self._active_jobs_lock:
+                self._active_jobs.pop(job.video_id, None)
+        if not info:
+            raise Exception("Video non disponibile o download non riuscito")
+
+        # I metadati di videos.list hanno la precedenza su quelli di yt-dlp
+        job.info = {**info, **job.metadata} if job.metadata else info
+        job.source_file = job.source_file or self._downloaded_filepath(info)
+        job.thumbnail_file = self._thumbnail_filepath(info)
+        job.infojson_file = info.get('infojson_filename')
+        if not job.source_file or not os.path.exists(job.source_file):
+            raise Exception("File scaricato non trovato")
+
+        self.rate_limiter.succeeded('media')
+
+    def _stream_download(self, job: VideoJob, ydl: 'yt_dlp.YoutubeDL', raw_info: dict) -> bool:
+        """Scarica il formato scelto a blocchi e lo passa a ffmpeg via stdin mentre arriva
+
+        La codifica si sovrappone al trasferimento e l'audio sorgente non viene mai scritto su
+        disco. Restituisce False se il formato non si presta (DASH, HLS, più stream, contenitore
+        non leggibile da una pipe): il video segue allora il percorso su file.
+        """
+        info = ydl.process_ie_result(dict(raw_info), download=False)
+        if not info:
+            raise Exception("Video non disponibile")
+        if (info.get('protocol') not in self.STREAMABLE_PROTOCOLS or info.get('requested_formats')
+                or info.get('fragments') or not info.get('url')):
+            return False
 
-                progress.update()
-                time.sleep(0.5)  # Pausa per evitare rate limiting
+        mp3_file = os.path.splitext(ydl.prepare_filename(info))[0] + '.mp3'
+        try:
+            job.media_bytes = self.stream_to_mp3(info, mp3_file, ydl.params.get('ffmpeg_location'))
+        except subprocess.SubprocessError as e:
+            self.events.emit('video_warning', folder=job.download_folder, video_id=job.video_id,
+                             message=f"Streaming non riuscito ({e}), download su file")
+            return False
 
-        # Riepilogo finale
-        self.print_summary(successful_downloads, failed_downloads, download_folder)
+        job.info = {**info, **job.metadata} if job.metadata else info
+        job.audio_file = mp3_file
+        return True
+
+    def iter_media_chunks(self, info: dict) -> Iterator[bytes]:
+        """Byte del formato scelto da yt-dlp, scaricati con richieste Range consecutive"""
+        headers = dict(info.get('http_headers') or {})
+        total = info.get('filesize')
+        rate = self.bandwidth / self.max_workers if self.bandwidth else None  # Come 'ratelimit' di yt-dlp
+        started = time.monotonic()
+        start = 0
+        while total is None or start < total:
+            headers['Range'] = f'bytes={start}-{start + self.STREAM_CHUNK_SIZE - 1}'
+            received = 0
+            self.rate_limiter.acquire('media')  # Ogni richiesta Range conta come quelle di yt-dlp
+            with self.http.stream(info['url'], headers=headers) as (response_headers, chunks):
+                # Dimensione totale dall'header Content-Range ("bytes 0-1023/4096")
+                content_range = response_headers.get('Content-Range', '')
+                if total is None and '/' in content_range and not content_range.endswith('*'):
+                    total = int(content_range.rsplit('/', 1)[1])
+                for chunk in chunks:
+                    received += len(chunk)
+                    yield chunk
+                    if rate:
+                        delay = (start + received) / rate - (time.monotonic() - started)
+                        if delay > 0:
+                            time.sleep(delay)
+            if not content_range or received < self.STREAM_CHUNK_SIZE:
+                return  # Ultimo blocco, oppure il server ha ignorato il Range e inviato tutto il file
+            start += received
+
+    def stream_to_mp3(self, info: dict, mp3_file: str, ffmpeg_location: Optional[str] = None,
+                      quality: str = '320') -> int:
+        """Converte in MP3 lo stream del formato scelto, passandolo a ffmpeg tramite pipe
+
+        Restituisce i byte ricevuti.
+        """
+        temp_file = mp3_file + '.part'
+        command = [
+            self.ffmpeg_executable(ffmpeg_location), '-y', '-loglevel', 'error',
+            '-i', 'pipe:0', '-vn', '-codec:a', 'libmp3lame', '-b:a', f'{quality}k',
+            '-f', 'mp3', temp_file,
+        ]
+
+        # Un MP4 con l'indice (moov) in fondo non è decodificabile da una pipe: si verifica
+        # sul primo blocco, prima di avviare ffmpeg
+        received = 0
+
+        def counted(source: Iterator[bytes]) -> Iterator[bytes]:
+            nonlocal received
+            for chunk in source:
+                received += len(chunk)
+                yield chunk
+
+        chunks = counted(self.iter_media_chunks(info))
+        head = next(chunks, b'')
+        if info.get('ext') in ('m4a', 'mp4') and not self.mp4_moov_first(head):
+            chunks.close()
+            raise subprocess.SubprocessError("indice MP4 in fondo al file")
+
+        # stderr su file temporaneo: una pipe piena bloccherebbe ffmpeg mentre scriviamo su stdin
+        with tempfile.TemporaryFile() as stderr_file:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                       stderr=stderr_file)
+            returncode = self._feed_ffmpeg(process, self._prepend(head, chunks), temp_file)
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors='replace')
+
+        if returncode == 0 and not os.path.getsize(temp_file):
+            returncode, stderr = 1, "nessun audio prodotto"
+        if returncode != 0:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            error_lines = stderr.strip().splitlines()
+            raise subprocess.SubprocessError(f"ffmpeg: {error_lines[-1] if error_lines else 'conversione non riuscita'}")
+
+        os.replace(temp_file, mp3_file)
+        return received
+
+    @staticmethod
+    def _prepend(head: bytes, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Rimette in testa allo stream il blocco già letto"""
+        yield head
+        yield from chunks
+
+    @staticmethod
+    def mp4_moov_first(data: bytes) -> bool:
+        """True se nei primi byte di un MP4 l'atomo moov precede mdat (leggibile in streaming)"""
+        offset = 0
+        while offset + 8 <= len(data):
+            size = int.from_bytes(data[offset:offset + 4], 'big')
+            box = data[offset + 4:offset + 8]
+            if box == b'moov':
+                return True
+            if box == b'mdat' or size == 0:
+                return False
+            if size == 1:  # Dimensione a 64 bit subito dopo il tipo
+                if offset + 16 > len(data):
+                    break
+                size = int.from_bytes(data[offset + 8:offset + 16], 'big')
+            if size < 8:
+                return False
+            offset += size
+        return True  # Atomi iniziali più lunghi del blocco: lo dirà ffmpeg
+
+    def _feed_ffmpeg(self, process: subprocess.Popen, chunks: Iterable[bytes], temp_file: str) -> int:
+        """Scrive i blocchi sullo stdin di ffmpeg e ne restituisce il codice di uscita"""
+        try:
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)  # Si blocca se ffmpeg è indietro: niente accumulo in memoria
+            except BrokenPipeError:
+                pass  # ffmpeg è terminato: l'errore arriva dal codice di uscita
+            finally:
+                with contextlib.suppress(BrokenPipeError):
+                    process.stdin.close()
+            return process.wait()
+        except BaseException:
+            # Errore di rete o interruzione: ffmpeg non deve restare appeso sullo stdin
+            process.kill()
+            process.wait()
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    def is_throttle_error(self, error: Exception) -> bool:
+        """True se l'errore di yt-dlp indica un rallentamento richiesto da YouTube"""
+        if isinstance(error, HttpStatusError):
+            # Richieste Range dello streaming: un 403 senza motivo di rate limit è un URL scaduto o
+            # negato, che va risolto di nuovo e non rallentato
+            if error.status_code == 403:
+                return error.response is not None and self.http.is_throttled(error.response)
+            return error.status_code == 429
+        message = str(error)
+        return any(marker in message for marker in ('HTTP Error 429', 'Too Many Requests', 'not a bot'))
+
+    def classify_error(self, error: BaseException) -> str:
+        """Classe di un errore: `PERMANENT`, `TRANSIENT`, `THROTTLED` oppure `UNKNOWN`
+
+        Considera anche l'eccezione originale avvolta da yt-dlp (`exc_info`) e la causa esplicita.
+        """
+        if self.is_throttle_error(error):
+            return self.THROTTLED
+        chain = []
+        while error is not None and error not in chain:
+            chain.append(error)
+            wrapped = getattr(error, 'exc_info', None)  # DownloadError ed ExtractorError di yt-dlp
+            error = (wrapped[1] if isinstance(wrapped, tuple) and len(wrapped) > 1 else None) or error.__cause__
+        message = ' '.join(str(e) for e in chain)
+        if any(marker in message for marker in self.PERMANENT_ERRORS):
+            return self.PERMANENT
+        for e in chain:
+            if isinstance(e, HttpStatusError):
+                if e.status_code >= 500 or e.status_code in (403, 404, 410):  # URL dei formati scaduto
+                    return self.TRANSIENT
+            elif isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                ConnectionError, TimeoutError)):
+                return self.TRANSIENT
+            if any(cls.__name__ in self.TRANSIENT_TYPES for cls in type(e).__mro__):
+                return self.TRANSIENT
+        if any(marker in message for marker in self.TRANSIENT_ERRORS):
+            return self.TRANSIENT
+        return self.UNKNOWN
+
+    def _transcode_stage(self, job: VideoJob, ffmpeg_location: Optional[str]):
+        """Stadio di transcodifica (CPU): converte l'audio sorgente in MP3 320 kbps
+
+        In modalità `native` il codec originale viene mantenuto: l'm4a resta com'è e il webm
+        viene solo rimuxato in .opus (copia dello stream, nessuna ricodifica).
+        """
+        if job.audio_file:
+            return  # Già convertito in streaming durante il download
+
+        base, ext = os.path.splitext(job.source_file)
+        ext = ext.lower()
+        if ext == '.mp3' or (self.output_format == 'native' and ext in self.NATIVE_EXTENSIONS):
+            job.audio_file = job.source_file
+            return
+
+        # Il webm di YouTube contiene Opus (raramente Vorbis): va solo spostato in un contenitore Ogg
+        acodec = ((job.info or {}).get('acodec') or 'opus').split('.')[0].lower()
+        if self.output_format == 'native' and ext == '.webm' and acodec in self.NATIVE_REMUX:
+            target = base + self.NATIVE_REMUX[acodec]
+            try:
+                with self.events.timer('remux', video_id=job.video_id):
+                    self.remux_audio(job.source_file, target, ffmpeg_location)
+                os.remove(job.source_file)
+                job.audio_file = target
+                return
+            except Exception:
+                pass  # Stream non copiabile nel contenitore: si converte in MP3
+
+        mp3_file = base + '.mp3'
+        with self.events.timer('transcode', video_id=job.video_id):
+            self.transcode_to_mp3(job.source_file, mp3_file, ffmpeg_location)
+        os.remove(job.source_file)  # Il file intermedio non serve più
+        job.audio_file = mp3_file
+
+    def _tag_stage(self, job: VideoJob, _context=None):
+        """Stadio di tag: metadati e copertina nel formato del file finale"""
+        with self.events.timer('tag', video_id=job.video_id) as span:
+            job.tagged = self.add_metadata(job.info, job.download_folder, job.audio_file,
+                                           job.thumbnail_file, job.cover_data) is not None
+            span['tagged'] = job.tagged
+        job.cover_data = None  # Libera la memoria appena la copertina è stata scritta
+        self.cleanup_temp_files(job.temp_files())
+
+    def transcode_to_mp3(self, source_file: str, mp3_file: str, ffmpeg_location: Optional[str] = None,
+                         quality: str = '320'):
+        """Converte un file audio in MP3 con ffmpeg"""
+        self._run_ffmpeg(source_file, mp3_file, ['-codec:a', 'libmp3lame', '-b:a', f'{quality}k', '-f', 'mp3'],
+                         ffmpeg_location)
+
+    def remux_audio(self, source_file: str, target_file: str, ffmpeg_location: Optional[str] = None):
+        """Cambia contenitore senza ricodificare (es. webm → opus): pochi millisecondi per brano"""
+        container = os.path.splitext(target_file)[1].lstrip('.').lower()
+        self._run_ffmpeg(source_file, target_file, ['-codec:a', 'copy', '-f', container], ffmpeg_location)
+
+    def _run_ffmpeg(self, source_file: str, target_file: str, output_args: List[str],
+                    ffmpeg_location: Optional[str] = None):
+        """Esegue ffmpeg su un file temporaneo e lo rinomina solo se la conversione riesce"""
+        temp_file = target_file + '.part'
+        command = [
+            self.ffmpeg_executable(ffmpeg_location), '-y', '-loglevel', 'error',
+            '-i', source_file, '-vn', *output_args, temp_file,
+        ]
+
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            error_lines = result.stderr.strip().splitlines()
+            raise Exception(f"ffmpeg: {error_lines[-1] if error_lines else 'conversione non riuscita'}")
+
+        os.replace(temp_file, target_file)
+
+    def ffmpeg_executable(self, ffmpeg_location: Optional[str] = None) -> str:
+        """Percorso dell'eseguibile ffmpeg (o solo il nome, se è nel PATH)"""
+        executable = 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg'
+        return os.path.join(ffmpeg_location, executable) if ffmpeg_location else executable
+
+    def _monitor_pipeline(self, stages: List[PipelineStage], stop: threading.Event, folder: str):
+        """Riporta periodicamente la profondità delle code di ogni stadio e aggiorna le metriche"""
+        while not stop.wait(self.report_interval):
+            self.events.emit('pipeline', folder=folder, stages=[
+                {'stage': stage.name, 'queue': stage.queue.qsize(), 'busy': stage.busy, 'workers': stage.workers,
+                 'processed': stage.processed, 'failed': stage.failed}
+                for stage in stages
+            ])
+            self.write_metrics()
+
+    def write_metrics(self):
+        """Aggiorna il file delle metriche Prometheus, se configurato"""
+        if not self.metrics_file:
+            return
+        try:
+            self.events.write_prometheus(self.metrics_file)
+        except OSError as e:
+            print(f"{Colors.WARNING}⚠️  Metriche non salvate: {e}{Colors.ENDC}")
+
+    def write_error_report(self, folder: str, errors: List[dict]) -> Optional[str]:
+        """Scrive gli errori completi (con traceback) dell'ultima run; None se non ce ne sono"""
+        path = os.path.join(folder, self.ERROR_REPORT)
+        if not errors:
+            if os.path.exists(path):
+                os.remove(path)  # Report di una run precedente, ormai superato
+            return None
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"{len(errors)} video non scaricati - {datetime.now():%Y-%m-%d %H:%M:%S}\n")
+                for error in errors:
+                    f.write(f"\n{'=' * 70}\n{error['url']}  {error['title'] or ''}\n")
+                    f.write(f"stadio: {error['stage']}\nclasse: {error['failure']} (tentativi: {error['attempts']})\n"
+                            f"errore: {error['error_type']}: {error['error']}\n\n")
+                    f.write(error['traceback'])
+        except OSError as e:
+            print(f"{Colors.WARNING}⚠️  Report degli errori non salvato: {e}{Colors.ENDC}")
+            return None
+        return path
+
+    def _downloaded_filepath(self, info: dict) -> Optional[str]:
+        """Percorso finale del file scaricato secondo yt-dlp"""
+        downloads = info.get('requested_downloads') or [{}]
+        return downloads[0].get('filepath') or info.get('filepath')
+
+    def _thumbnail_filepath(self, info: dict) -> Optional[str]:
+        """Percorso della thumbnail scritta da yt-dlp, se presente"""
+        for thumbnail in reversed(info.get('thumbnails') or []):
+            if thumbnail.get('filepath'):
+                return thumbnail['filepath']
+        return None
 
     def find_ffmpeg(self) -> Optional[str]:
         """Cerca ffmpeg nel sistema"""
@@ -231,26 +2889,74 @@ class YouTubePlaylistDownloader:
                 return path
         return None
 
-    def add_metadata_to_mp3(self, video_info: dict, download_folder: str):
-        """Aggiunge metadati completi al file MP3"""
-        try:
-            # Costruisci il nome del file MP3
-            title = video_info.get('title', 'Unknown')
-            # Pulisci il titolo da caratteri non validi per il filesystem
-            clean_title = re.sub(r'[<>:"/\\|?*]', '', title)
-            mp3_file = os.path.join(download_folder, f"{clean_title}.mp3")
+    def add_metadata(self, video_info: dict, download_folder: str, audio_file: Optional[str] = None,
+                     thumbnail_file: Optional[str] = None, cover_data: Optional[bytes] = None) -> Optional[str]:
+        """Aggiunge metadati e copertina con il backend mutagen adatto al formato del file"""
+        ext = os.path.splitext(audio_file)[1].lower() if audio_file else '.mp3'
+        if ext in ('.m4a', '.mp4'):
+            return self.add_metadata_to_m4a(video_info, audio_file, thumbnail_file, cover_data)
+        if ext in ('.opus', '.ogg'):
+            return self.add_metadata_to_ogg(video_info, audio_file, thumbnail_file, cover_data)
+        return self.add_metadata_to_mp3(video_info, download_folder, audio_file, thumbnail_file, cover_data)
+
+    def tag_fields(self, video_info: dict) -> Dict[str, str]:
+        """Campi comuni a tutti i formati: titolo, artista, artista album, album e anno"""
+        title = video_info.get('title', 'Unknown Title')
+        uploader = video_info.get('uploader', 'Unknown Artist')
+        upload_date = video_info.get('upload_date', '')
+
+        # Pulisci il nome dell'artista (rimuove "- Topic" comune nei canali musicali)
+        artist = re.sub(r'\s*-\s*Topic\s*$', '', uploader)
+
+        # Estrai album/artista dal titolo se possibile (formato: "Artista - Titolo")
+        if ' - ' in title:
+            parts = title.split(' - ', 1)
+            if len(parts) == 2:
+                extracted_artist = parts[0].strip()
+                extracted_title = parts[1].strip()
+                if len(extracted_artist) < 50:  # Ragionevole per essere un artista
+                    artist = extracted_artist
+                    title = extracted_title
+
+        # Formatta la data
+        year = ''
+        if upload_date and len(upload_date) >= 4:
+            year = upload_date[:4]
+
+        return {'title': title, 'artist': artist, 'album_artist': uploader, 'album': "YouTube Download",
+                'year': year}
+
+    def _report_tagged(self, video_info: dict, audio_file: str, fields: Dict[str, str], thumbnail_added: bool):
+        """Evento di conferma dopo la scrittura dei tag (mostrato dal renderer della cartella)"""
+        self.events.emit('video_tagged', folder=os.path.dirname(audio_file), video_id=video_info.get('id'),
+                         file=audio_file, artist=fields['artist'], title=fields['title'], cover=thumbnail_added)
+
+    def _report_tag_warning(self, video_info: dict, audio_file: Optional[str], message: str):
+        """Avviso sulla scrittura dei tag di un file, riferito alla cartella del file"""
+        self.events.emit('video_warning', folder=os.path.dirname(audio_file) if audio_file else None,
+                         video_id=video_info.get('id'), file=audio_file, message=message)
+
+    def add_metadata_to_mp3(self, video_info: dict, download_folder: str, mp3_file: Optional[str] = None,
+                            thumbnail_file: Optional[str] = None, cover_data: Optional[bytes] = None) -> Optional[str]:
+        """Aggiunge metadati completi al file MP3, restituisce il percorso del file taggato
+
+        `mp3_file` e `thumbnail_file` sono i percorsi reali registrati durante il download; senza
+        `mp3_file` il nome viene ricostruito dal titolo. `cover_data` è la copertina già in memoria.
+        """
+        from mutagen.id3 import ID3, TALB, TDRC, TIT2, TPE1, TPE2
+        from mutagen.mp3 import MP3
 
-            # Se il file non esiste, prova varianti
-            if not os.path.exists(mp3_file):
-                # Cerca file che iniziano con il titolo
-                for file in os.listdir(download_folder):
-                    if file.startswith(clean_title[:30]) and file.endswith('.mp3'):
-                        mp3_file = os.path.join(download_folder, file)
-                        break
+        try:
+            if not mp3_file:
+                # Costruisci il nome del file MP3
+                title = video_info.get('title', 'Unknown')
+                # Pulisci il titolo da caratteri non validi per il filesystem
+                clean_title = re.sub(r'[<>:"/\\|?*]', '', title)
+                mp3_file = os.path.join(download_folder, f"{clean_title}.mp3")
 
             if not os.path.exists(mp3_file):
-                print(f"{Colors.WARNING}⚠️  File MP3 non trovato per aggiungere metadati{Colors.ENDC}")
-                return
+                self._report_tag_warning(video_info, mp3_file, "File MP3 non trovato per aggiungere metadati")
+                return None
 
             # Carica il file MP3
             audio = MP3(mp3_file, ID3=ID3)
@@ -259,161 +2965,204 @@ class YouTubePlaylistDownloader:
             if audio.tags is None:
                 audio.add_tags()
 
-            # Estrai informazioni dal video
-            title = video_info.get('title', 'Unknown Title')
-            uploader = video_info.get('uploader', 'Unknown Artist')
-            upload_date = video_info.get('upload_date', '')
-            duration = video_info.get('duration', 0)
-            view_count = video_info.get('view_count', 0)
-            description = video_info.get('description', '')[:500]  # Limita descrizione
-
-            # Pulisci il nome dell'artista (rimuove "- Topic" comune nei canali musicali)
-            artist = re.sub(r'\s*-\s*Topic\s*$', '', uploader)
-
-            # Estrai album/artista dal titolo se possibile (formato: "Artista - Titolo")
-            if ' - ' in title:
-                parts = title.split(' - ', 1)
-                if len(parts) == 2:
-                    extracted_artist = parts[0].strip()
-                    extracted_title = parts[1].strip()
-                    if len(extracted_artist) < 50:  # Ragionevole per essere un artista
-                        artist = extracted_artist
-                        title = extracted_title
-
-            # Formatta la data
-            year = ''
-            if upload_date and len(upload_date) >= 4:
-                year = upload_date[:4]
+            fields = self.tag_fields(video_info)
 
             # Aggiungi metadati ID3
-            audio.tags.add(TIT2(encoding=3, text=title))  # Titolo
-            audio.tags.add(TPE1(encoding=3, text=artist))  # Artista principale
-            audio.tags.add(TPE2(encoding=3, text=uploader))  # Artista album (uploader originale)
-            audio.tags.add(TALB(encoding=3, text="YouTube Download"))  # Album
+            audio.tags.add(TIT2(encoding=3, text=fields['title']))  # Titolo
+            audio.tags.add(TPE1(encoding=3, text=fields['artist']))  # Artista principale
+            audio.tags.add(TPE2(encoding=3, text=fields['album_artist']))  # Artista album (uploader originale)
+            audio.tags.add(TALB(encoding=3, text=fields['album']))  # Album
 
-            if year:
-                audio.tags.add(TDRC(encoding=3, text=year))  # Anno
+            if fields['year']:
+                audio.tags.add(TDRC(encoding=3, text=fields['year']))  # Anno
 
             # Aggiungi thumbnail come copertina
-            thumbnail_added = self.add_thumbnail_to_mp3(audio, video_info, download_folder, clean_title)
+            thumbnail_added = self.add_thumbnail_to_mp3(audio, video_info, thumbnail_file, cover_data)
 
-            # Salva le modifiche
+            # Salva le modifiche (unica scrittura del file)
             audio.save()
 
-            # Pulizia file temporanei
-            self.cleanup_temp_files(download_folder, clean_title)
-
-            print(f"{Colors.OKCYAN}🎯 Metadati aggiunti: {artist} - {title[:30]}...{Colors.ENDC}")
-            if thumbnail_added:
-                print(f"{Colors.OKGREEN}🖼️  Copertina aggiunta!{Colors.ENDC}")
+            self._report_tagged(video_info, mp3_file, fields, thumbnail_added)
+            return mp3_file
 
         except Exception as e:
-            print(f"{Colors.WARNING}⚠️  Errore aggiunta metadati: {str(e)[:50]}...{Colors.ENDC}")
+            self._report_tag_warning(video_info, mp3_file, f"Errore aggiunta metadati: {str(e)[:50]}...")
+            return None
+
+    def add_metadata_to_m4a(self, video_info: dict, audio_file: str, thumbnail_file: Optional[str] = None,
+                            cover_data: Optional[bytes] = None) -> Optional[str]:
+        """Aggiunge metadati e copertina a un file M4A/AAC (atomi MP4)"""
+        from mutagen.mp4 import MP4, MP4Cover
 
-    def add_thumbnail_to_mp3(self, audio: MP3, video_info: dict, download_folder: str, clean_title: str) -> bool:
-        """Aggiunge la thumbnail come copertina del file MP3"""
         try:
-            # Cerca file thumbnail
-            possible_thumbnails = [
-                f"{clean_title}.jpg",
-                f"{clean_title}.webp",
-                f"{clean_title}.png"
-            ]
-
-            thumbnail_file = None
-            for thumb_name in possible_thumbnails:
-                thumb_path = os.path.join(download_folder, thumb_name)
-                if os.path.exists(thumb_path):
-                    thumbnail_file = thumb_path
-                    break
+            if not os.path.exists(audio_file):
+                self._report_tag_warning(video_info, audio_file, "File M4A non trovato per aggiungere metadati")
+                return None
 
-            # Se non trova file locali, usa URL thumbnail
-            if not thumbnail_file and 'thumbnail' in video_info:
-                thumbnail_url = video_info['thumbnail']
-                try:
-                    # Scarica thumbnail da URL
-                    response = urllib.request.urlopen(thumbnail_url, timeout=10)
-                    img_data = response.read()
-
-                    # Converti e ridimensiona immagine
-                    img = Image.open(BytesIO(img_data))
-
-                    # Ridimensiona se troppo grande (ottimizzazione per Android)
-                    max_size = (500, 500)
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-
-                    # Converti in JPEG se necessario
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode == 'P':
-                            img = img.convert('RGBA')
-                        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                        img = background
-
-                    # Salva immagine ottimizzata
-                    img_buffer = BytesIO()
-                    img.save(img_buffer, format='JPEG', quality=85, optimize=True)
-                    img_data = img_buffer.getvalue()
-
-                except Exception:
-                    return False
-            else:
-                # Leggi file thumbnail locale
-                if thumbnail_file:
-                    try:
-                        with open(thumbnail_file, 'rb') as f:
-                            img_data = f.read()
-
-                        # Ottimizza immagine locale
-                        img = Image.open(BytesIO(img_data))
-                        max_size = (500, 500)
-                        img.thumbnail(max_size, Image.Resampling.LANCZOS)
-
-                        if img.mode in ('RGBA', 'LA', 'P'):
-                            background = Image.new('RGB', img.size, (255, 255, 255))
-                            if img.mode == 'P':
-                                img = img.convert('RGBA')
-                            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                            img = background
-
-                        img_buffer = BytesIO()
-                        img.save(img_buffer, format='JPEG', quality=85, optimize=True)
-                        img_data = img_buffer.getvalue()
-
-                    except Exception:
-                        return False
-                else:
-                    return False
+            audio = MP4(audio_file)
+            if audio.tags is None:
+                audio.add_tags()
 
-            # Aggiungi copertina ai metadati ID3
-            audio.tags.add(APIC(
-                encoding=3,  # UTF-8
-                mime='image/jpeg',
-                type=3,  # Cover (front)
-                desc='Cover',
-                data=img_data
-            ))
+            fields = self.tag_fields(video_info)
+            audio.tags['\xa9nam'] = [fields['title']]  # Titolo
+            audio.tags['\xa9ART'] = [fields['artist']]  # Artista principale
+            audio.tags['aART'] = [fields['album_artist']]  # Artista album
+            audio.tags['\xa9alb'] = [fields['album']]  # Album
+            if fields['year']:
+                audio.tags['\xa9day'] = [fields['year']]  # Anno
 
-            return True
+            img_data = self.cover_art(video_info, thumbnail_file, cover_data, os.path.dirname(audio_file))
+            if img_data:
+                audio.tags['covr'] = [MP4Cover(img_data, imageformat=MP4Cover.FORMAT_JPEG)]
+
+            audio.save()
+
+            self._report_tagged(video_info, audio_file, fields, img_data is not None)
+            return audio_file
 
         except Exception as e:
-            print(f"{Colors.WARNING}⚠️  Errore thumbnail: {str(e)[:30]}...{Colors.ENDC}")
+            self._report_tag_warning(video_info, audio_file, f"Errore aggiunta metadati: {str(e)[:50]}...")
+            return None
+
+    def add_metadata_to_ogg(self, video_info: dict, audio_file: str, thumbnail_file: Optional[str] = None,
+                            cover_data: Optional[bytes] = None) -> Optional[str]:
+        """Aggiunge metadati e copertina a un file Opus/Vorbis (Vorbis comment e METADATA_BLOCK_PICTURE)"""
+        from mutagen.flac import Picture
+        from mutagen.oggopus import OggOpus
+        from mutagen.oggvorbis import OggVorbis
+        from PIL import Image
+
+        try:
+            if not os.path.exists(audio_file):
+                self._report_tag_warning(video_info, audio_file, "File Ogg non trovato per aggiungere metadati")
+                return None
+
+            audio = OggOpus(audio_file) if audio_file.lower().endswith('.opus') else OggVorbis(audio_file)
+
+            fields = self.tag_fields(video_info)
+            audio['title'] = fields['title']
+            audio['artist'] = fields['artist']
+            audio['albumartist'] = fields['album_artist']
+            audio['album'] = fields['album']
+            if fields['year']:
+                audio['date'] = fields['year']
+
+            img_data = self.cover_art(video_info, thumbnail_file, cover_data, os.path.dirname(audio_file))
+            if img_data:
+                picture = Picture()
+                picture.type = 3  # Cover (front)
+                picture.mime = 'image/jpeg'
+                picture.desc = 'Cover'
+                picture.data = img_data
+                with Image.open(BytesIO(img_data)) as img:
+                    picture.width, picture.height = img.size
+                picture.depth = 24
+                audio['metadata_block_picture'] = [b64encode(picture.write()).decode('ascii')]
+
+            audio.save()
+
+            self._report_tagged(video_info, audio_file, fields, img_data is not None)
+            return audio_file
+
+        except Exception as e:
+            self._report_tag_warning(video_info, audio_file, f"Errore aggiunta metadati: {str(e)[:50]}...")
+            return None
+
+    def add_thumbnail_to_mp3(self, audio: 'MP3', video_info: dict, thumbnail_file: Optional[str] = None,
+                             cover_data: Optional[bytes] = None) -> bool:
+        """Aggiunge la thumbnail come copertina del file MP3"""
+        from mutagen.id3 import APIC
+
+        img_data = self.cover_art(video_info, thumbnail_file, cover_data, os.path.dirname(audio.filename))
+        if not img_data:
             return False
 
-    def cleanup_temp_files(self, download_folder: str, clean_title: str):
-        """Rimuove file temporanei dopo l'elaborazione"""
-        temp_extensions = ['.webp', '.jpg', '.png', '.info.json', '.part']
+        # Aggiungi copertina ai metadati ID3
+        audio.tags.add(APIC(
+            encoding=3,  # UTF-8
+            mime='image/jpeg',
+            type=3,  # Cover (front)
+            desc='Cover',
+            data=img_data
+        ))
+        return True
+
+    def cover_art(self, video_info: dict, thumbnail_file: Optional[str] = None,
+                  cover_data: Optional[bytes] = None, folder: Optional[str] = None) -> Optional[bytes]:
+        """Copertina pronta per i tag (JPEG con il lato lungo max 500px), o None se non disponibile
+
+        `folder` è la cartella a cui riferire l'eventuale avviso.
+        """
+        try:
+            with self.events.timer('thumbnail', video_id=video_info.get('id')) as span:
+                img_data = self.load_cover_source(video_info, thumbnail_file, cover_data)
+                if not img_data:
+                    span['found'] = False
+                    return None
+                span['bytes'] = len(img_data)
+                return self.cover_processor.process(img_data)
 
-        for file in os.listdir(download_folder):
-            if file.startswith(clean_title):
-                for ext in temp_extensions:
-                    if file.endswith(ext):
-                        try:
-                            os.remove(os.path.join(download_folder, file))
-                        except:
-                            pass  # Ignora errori di rimozione
+        except Exception as e:
+            self.events.emit('video_warning', folder=folder, video_id=video_info.get('id'),
+                             message=f"Errore thumbnail: {str(e)[:30]}...")
+            return None
+
+    def load_cover_source(self, video_info: dict, thumbnail_file: Optional[str] = None,
+                          cover_data: Optional[bytes] = None) -> Optional[bytes]:
+        """Restituisce l'immagine originale della copertina: in memoria, file locale o URL"""
+        if cover_data:
+            return cover_data
+
+        # Thumbnail locale scritta da yt-dlp, se presente
+        if thumbnail_file and os.path.exists(thumbnail_file):
+            with open(thumbnail_file, 'rb') as f:
+                return f.read()
+
+        if video_info.get('thumbnail'):
+            return self.fetch_thumbnail_data(video_info['thumbnail'])
+        return None
 
-    def print_summary(self, successful: int, failed: List, folder: str):
+    def fetch_thumbnail_data(self, thumbnail_url: str) -> Optional[bytes]:
+        """Scarica la thumbnail in memoria, None se non disponibile"""
+        try:
+            return self.http.get(thumbnail_url, timeout=10, budget='thumbnail').content
+        except requests.exceptions.RequestException:
+            return None
+
+    def cleanup_temp_files(self, temp_files: Iterable[str]):
+        """Rimuove i file temporanei registrati durante l'elaborazione"""
+        for path in temp_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Ignora errori di rimozione
+
+    def print_pipeline_stats(self, stages: List[PipelineStage], elapsed: float):
+        """Stampa le statistiche di ogni stadio per individuare il collo di bottiglia"""
+        print(f"\n{Colors.OKBLUE}📊 Statistiche pipeline ({elapsed:.1f}s):{Colors.ENDC}")
+        for stage in stages:
+            done = stage.processed + stage.failed
+            average = stage.busy_time / done if done else 0.0
+            print(f"   • {stage.name}: {stage.processed} ok, {stage.failed} errori, "
+                  f"{average:.1f}s/video, coda max {stage.max_depth}, "
+                  f"utilizzo {stage.utilization(elapsed) * 100:.0f}%")
+
+        bottleneck = max(stages, key=lambda stage: stage.utilization(elapsed))
+        if bottleneck.utilization(elapsed) > 0:
+            print(f"   {Colors.WARNING}⏳ Collo di bottiglia: {bottleneck.name}{Colors.ENDC}")
+
+        http = self.http.stats()
+        print(f"   • HTTP{'/2' if http['http2'] else ''}: {http['requests']} richieste, "
+              f"{http['connections']} connessioni (riuso {http['reuse_ratio'] * 100:.0f}%), "
+              f"connessione media {http['avg_connect_ms']:.0f} ms")
+
+        limits = ', '.join(f"{name} {bucket['rate']:.1f}/s ({bucket['throttled']} rallentamenti)"
+                           for name, bucket in self.rate_limiter.stats().items())
+        print(f"   • Limiti: {limits}")
+        print(f"   • Quota API: {self.quota.used}/{self.quota.daily_limit} unità oggi")
+
+    def print_summary(self, successful: int, failed: List, folder: str, error_report: Optional[str] = None,
+                      unavailable: int = 0):
         """Stampa il riepilogo finale"""
         print(f"\n{Colors.HEADER}{'=' * 70}")
         print("🎉 DOWNLOAD COMPLETATO!")
@@ -423,9 +3172,16 @@ class YouTubePlaylistDownloader:
 
         if failed:
             print(f"{Colors.FAIL}❌ Download falliti: {len(failed)}{Colors.ENDC}")
+            if unavailable:
+                print(f"{Colors.WARNING}⏭️  Di cui non disponibili (saltati dalle prossime sincronizzazioni): "
+                      f"{unavailable}{Colors.ENDC}")
             print(f"{Colors.WARNING}⚠️  File con errori:{Colors.ENDC}")
             for url, error in failed[:5]:  # Mostra solo i primi 5 errori
                 print(f"   • {url[:50]}... - {error[:50]}...")
+            if len(failed) > 5:
+                print(f"   … e altri {len(failed) - 5}")
+            if error_report:
+                print(f"{Colors.WARNING}📄 Errori completi: {error_report}{Colors.ENDC}")
 
         print(f"\n{Colors.OKCYAN}📂 I file sono stati salvati in:{Colors.ENDC}")
         print(f"   {folder}")
@@ -433,30 +3189,286 @@ class YouTubePlaylistDownloader:
         print(f"\n{Colors.OKGREEN}🎵 Buon ascolto! I file sono ottimizzati per Android 📱{Colors.ENDC}")
 
 
+class PlaylistBatch:
+    """Scarica più playlist con un solo downloader, senza interazione
+
+    Ogni playlist ha la propria cartella (con archivio e diario). Download contemporanei, banda,
+    rate limiter e quota API sono condivisi da tutte le playlist, e un video presente in più
+    playlist viene scaricato e convertito una volta sola, poi collegato nelle altre cartelle.
+    """
+
+    def __init__(self, downloader: YouTubePlaylistDownloader, output_root: str, jobs: int = 2,
+                 sync: bool = False):
+        self.downloader = downloader
+        self.output_root = output_root
+        self.jobs = max(1, jobs)  # Playlist elaborate contemporaneamente
+        self.sync = sync
+
+    def resolve(self, links: Iterable[str]) -> List[dict]:
+        """Trova ID, titolo, numero di video e cartella di ogni playlist"""
+        playlists, folders = [], set()
+        for link in links:
+            playlist_id = self.downloader.get_playlist_id(link)
+            if not playlist_id and re.fullmatch(r'[a-zA-Z0-9_-]+', link):
+                playlist_id = link  # ID passato direttamente
+            if not playlist_id:
+                print(f"{Colors.FAIL}❌ ID playlist non trovato nel link: {link}{Colors.ENDC}")
+                continue
+
+            count = self.downloader.get_playlist_size(playlist_id)
+            if not count:
+                print(f"{Colors.FAIL}❌ Nessun video trovato nella playlist {playlist_id}{Colors.ENDC}")
+                continue
+
+            title = self.downloader.get_playlist_title(playlist_id) or playlist_id
+            name = re.sub(r'[<>:"/\\|?*]', '', title).strip() or playlist_id
+            if name in folders:
+                name = f"{name} [{playlist_id}]"  # Titoli uguali: cartelle distinte
+            folders.add(name)
+            playlists.append({'id': playlist_id, 'title': title, 'count': count,
+                              'folder': os.path.join(self.output_root, name)})
+            print(f"{Colors.OKGREEN}✅ {title}: {count} video{Colors.ENDC}")
+        return playlists
+
+    def run(self, links: Iterable[str]) -> int:
+        """Scarica tutte le playlist e restituisce il numero di errori
+
+        Contano i video non riusciti, le playlist non trovate e quelle non elaborate affatto.
+        """
+        downloader = self.downloader
+        downloader.shared_files = SharedFiles()
+        downloader.download_slots = threading.BoundedSemaphore(downloader.max_workers)
+
+        links = list(links)
+        playlists = self.resolve(links)
+        unresolved = len(links) - len(playlists)
+        if unresolved:
+            print(f"{Colors.FAIL}❌ Playlist non trovate: {unresolved}{Colors.ENDC}")
+        if not playlists:
+            return unresolved
+
+        if self.sync:
+            # File già presenti in una delle cartelle: nelle altre vengono solo collegati
+            for playlist in playlists:
+                if os.path.exists(os.path.join(playlist['folder'], DownloadArchive.FILENAME)):
+                    archive = DownloadArchive(playlist['folder'])
+                    try:
+                        for video_id, path in archive.completed_files().items():
+                            downloader.shared_files.add(video_id, path)
+                    finally:
+                        archive.close()
+
+        slots = threading.BoundedSemaphore(self.jobs)
+        results = {}
+
+        def run_playlist(playlist: dict):
+            with slots:
+                results[playlist['id']] = downloader.download_audio(
+                    downloader.iter_playlist_videos(playlist['id']), playlist['folder'], sync=self.sync,
+                    total=playlist['count'], source=playlist['id'],
+                )
+
+        # Thread daemon: Ctrl+C interrompe subito anche le playlist in corso
+        threads = [threading.Thread(target=run_playlist, args=(playlist,), name=f"playlist-{playlist['id']}",
+                                    daemon=True) for playlist in playlists]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            downloader._wait(thread)
+
+        return self.print_report(playlists, results) + unresolved
+
+    def preview(self, links: Iterable[str]) -> int:
+        """Elenco senza download: video di ogni playlist e quelli non ancora nell'archivio
+
+        Usa solo la Data API tramite il client HTTP (yt-dlp non viene nemmeno importato) e
+        stampa i link dei video nuovi, uno per riga. Restituisce quanti sono in tutto.
+        """
+        downloader = self.downloader
+        total_new = 0
+        for playlist in self.resolve(links):
+            completed = set()
+            if os.path.exists(os.path.join(playlist['folder'], DownloadArchive.FILENAME)):
+                archive = DownloadArchive(playlist['folder'])
+                try:
+                    completed = archive.completed_ids() | archive.unavailable_ids(downloader.recheck_unavailable)
+                finally:
+                    archive.close()
+
+            try:
+                new = [url for url in downloader.iter_playlist_videos(playlist['id'])
+                       if downloader.get_video_id(url) not in completed]
+            except QuotaExceededError as e:
+                print(f"{Colors.FAIL}⛔ {playlist['title']}: {e}{Colors.ENDC}")
+                continue
+            except requests.exceptions.RequestException as e:
+                print(f"{Colors.FAIL}❌ {playlist['title']}: errore di connessione: {e}{Colors.ENDC}")
+                continue
+
+            total_new += len(new)
+            print(f"\n{Colors.OKCYAN}🎵 {playlist['title']}: {playlist['count']} video, {len(new)} da scaricare "
+                  f"→ {playlist['folder']}{Colors.ENDC}")
+            for url in new:
+                print(f"   + {url}")
+
+        print(f"\n{Colors.OKGREEN}📋 Video da scaricare in tutto: {total_new}{Colors.ENDC}")
+        return total_new
+
+    def print_report(self, playlists: List[dict], results: Dict[str, Optional[dict]]) -> int:
+        """Riepilogo per playlist; restituisce il numero totale di video non riusciti"""
+        print(f"\n{Colors.HEADER}{'=' * 60}{Colors.ENDC}")
+        print(f"{Colors.HEADER}📋 RIEPILOGO BATCH{Colors.ENDC}")
+        print(f"{Colors.HEADER}{'=' * 60}{Colors.ENDC}")
+
+        failures = 0
+        for playlist in playlists:
+            result = results.get(playlist['id'])
+            if result is None:
+                # Cartella non creata o download mai partito: conta come errore
+                failures += 1
+                print(f"{Colors.FAIL}❌ {playlist['title']}: non elaborata → {playlist['folder']}{Colors.ENDC}")
+                continue
+            failures += len(result['failed'])
+            print(f"{Colors.OKCYAN}🎵 {playlist['title']}: {result['successful']} ok, "
+                  f"{len(result['failed'])} errori → {playlist['folder']}{Colors.ENDC}")
+        if self.downloader.shared_files.linked:
+            print(f"{Colors.OKGREEN}🔗 Video condivisi tra playlist collegati senza riscaricarli: "
+                  f"{self.downloader.shared_files.linked}{Colors.ENDC}")
+        return failures
+
+
+class QueueWorker:
+    """Worker che elabora una parte di un job condiviso tramite la WorkQueue della cartella di output
+
+    Si possono avviare più worker (processi o macchine con la stessa cartella condivisa): il primo
+    carica l'elenco nella coda, tutti reclamano i video uno alla volta. I file intermedi restano
+    in una cartella di staging del worker e arrivano nell'output solo completi, con un rename.
+    """
+
+    def __init__(self, downloader: YouTubePlaylistDownloader, output_folder: str, worker_id: Optional[str] = None,
+                 lease: float = 300.0, max_attempts: int = 3):
+        self.downloader = downloader
+        self.output_folder = output_folder
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+    def run(self, links: Iterable[str]) -> int:
+        """Elabora i video finché la coda non è esaurita
+
+        Restituisce il numero di errori definitivi, più uno se l'elenco non è stato caricato.
+        """
+        downloader = self.downloader
+        if not downloader.create_download_folder(self.output_folder):
+            return 1
+
+        work_queue = WorkQueue(self.output_folder, lease=self.lease, max_attempts=self.max_attempts)
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(work_queue, stop), name="queue-heartbeat",
+                                     daemon=True)
+        # Gli eventi del caricamento dell'elenco (video saltati, metadati) sono riferiti alla cartella
+        # di output; quelli dei download alla cartella di staging, con il renderer di `download_audio`
+        lister_renderer = ConsoleRenderer(self.output_folder, None)
+        downloader.events.subscribe(lister_renderer)
+        try:
+            work_queue.release(self.worker_id)  # Claim rimasti da un'esecuzione precedente con lo stesso ID
+            heartbeat.start()
+            print(f"{Colors.OKCYAN}🧩 Worker {self.worker_id} sulla coda {work_queue.path}{Colors.ENDC}")
+
+            # Il primo worker carica l'elenco in background, gli altri iniziano subito a scaricare;
+            # se chi lo carica muore, lo riprende un worker rimasto senza lavoro
+            links = list(links)
+            listers = []
+
+            def start_lister():
+                if not any(lister.is_alive() for lister in listers):
+                    lister = threading.Thread(target=self._populate, args=(work_queue, links), name="queue-lister",
+                                              daemon=True)
+                    listers.append(lister)
+                    lister.start()
+
+            start_lister()
+
+            staging = os.path.join(self.output_folder, WorkQueue.STAGING_DIR,
+                                   re.sub(r'[^a-zA-Z0-9_.-]', '_', self.worker_id))
+            downloader.work_queue, downloader.worker_id = work_queue, self.worker_id
+            max_in_flight = downloader.max_workers + downloader.prefetch + 1
+            claims = work_queue.iter_claims(self.worker_id, max_in_flight, on_idle=start_lister)
+            results = downloader.download_audio(claims, staging, resume=False, with_metadata=True)
+            for lister in listers:
+                downloader._wait(lister)
+
+            if results and results.get('finished'):
+                shutil.rmtree(staging, ignore_errors=True)
+            counts = work_queue.counts()
+            print(f"{Colors.OKCYAN}🧩 Coda: {counts.get('done', 0)} completati, {counts.get('failed', 0)} falliti, "
+                  f"{counts.get('pending', 0) + counts.get('claimed', 0)} da elaborare{Colors.ENDC}")
+            if counts['listing_failed']:
+                print(f"{Colors.FAIL}❌ Elenco delle playlist non caricato: {work_queue.listing_error()}{Colors.ENDC}")
+                return counts.get('failed', 0) + 1
+            return counts.get('failed', 0)
+        finally:
+            stop.set()
+            downloader.events.unsubscribe(lister_renderer)
+            downloader.work_queue = None
+            work_queue.close()
+
+    def _populate(self, work_queue: WorkQueue, links: List[str]):
+        """Carica nella coda i video delle playlist, se nessun altro worker lo sta già facendo"""
+        if not work_queue.acquire_listing(self.worker_id):
+            return
+        downloader = self.downloader
+        for link in links:
+            playlist_id = downloader.get_playlist_id(link) or link
+            urls = downloader.iter_playlist_videos(playlist_id)
+            entries = downloader.iter_with_metadata(urls, folder=self.output_folder) if downloader.batch_metadata \
+                else ((url, None) for url in urls)
+            try:
+                added = work_queue.add(((downloader.get_video_id(url) or url, url, metadata)
+                                        for url, metadata in entries), self.worker_id)
+            except Exception as e:
+                # L'elenco resta incompleto: lo riprende un worker dopo il backoff, fino a `max_attempts` volte
+                delay = work_queue.fail_listing(self.worker_id, f"{playlist_id}: {e}")
+                retry = f"nuovo tentativo tra {delay:.0f}s" if delay is not None else "elenco segnato come fallito"
+                print(f"{Colors.FAIL}❌ Errore durante il caricamento di {playlist_id}: {e} ({retry}){Colors.ENDC}")
+                return
+            print(f"{Colors.OKGREEN}✅ {playlist_id}: {added} video aggiunti alla coda{Colors.ENDC}")
+        work_queue.finish_listing(self.worker_id)
+
+    def _heartbeat(self, work_queue: WorkQueue, stop: threading.Event):
+        """Rinnova i lease a intervalli regolari finché il worker è attivo"""
+        while not stop.wait(self.lease / 3):
+            try:
+                work_queue.heartbeat(self.worker_id)
+            except sqlite3.Error as e:
+                print(f"{Colors.WARNING}⚠️  Heartbeat non riuscito: {e}{Colors.ENDC}")
+
+
 def main():
     """Funzione principale"""
     # Configurazione
     API_KEY = 'API_KEY'  # ⚠️ CAMBIA CON LA TUA API KEY
     DEFAULT_FOLDER = os.path.join(os.path.expanduser("~"), "Download", "Youtube MP3")
-
-    # Verifica dipendenze
-    missing_deps = []
-    try:
-        import mutagen
-    except ImportError:
-        missing_deps.append('mutagen')
-
-    try:
-        from PIL import Image
-    except ImportError:
-        missing_deps.append('Pillow')
+    MAX_WORKERS = 4  # Video scaricati in parallelo
+    PREFETCH = 2  # Video successivi risolti mentre quelli correnti si scaricano
+    REGION = None  # Codice paese (es. 'IT') per saltare i video bloccati in quella regione; None: nessun filtro
+    IN_MEMORY = True  # Metadati e copertina passati in memoria, senza file temporanei su disco
+    OUTPUT_FORMAT = 'mp3'  # 'native' mantiene l'audio originale (m4a/opus) senza ricodifica
+    STREAM_TRANSCODE = False  # Passa i byte a ffmpeg mentre si scaricano (niente file intermedio)
+    EVENTS_FILE = None  # Es. 'eventi.jsonl': tempi di ogni stadio, byte e retry in JSON lines
+
+    # Verifica dipendenze (senza importarle: vengono caricate solo quando servono)
+    missing_deps = [package for module, package in (('mutagen', 'mutagen'), ('PIL', 'Pillow'))
+                    if importlib.util.find_spec(module) is None]
 
     if missing_deps:
         print(f"{Colors.FAIL}❌ Dipendenze mancanti: {', '.join(missing_deps)}{Colors.ENDC}")
         print(f"{Colors.OKCYAN}💡 Installa con: pip install {' '.join(missing_deps)}{Colors.ENDC}")
         return
 
-    downloader = YouTubePlaylistDownloader(API_KEY)
+    downloader = YouTubePlaylistDownloader(API_KEY, max_workers=MAX_WORKERS, prefetch=PREFETCH, region=REGION,
+                                           in_memory=IN_MEMORY, output_format=OUTPUT_FORMAT,
+                                           stream_transcode=STREAM_TRANSCODE, events_file=EVENTS_FILE)
     downloader.print_banner()
 
     print(f"{Colors.OKGREEN}📱 Ottimizzato per Android - Include metadati e copertine!{Colors.ENDC}\n")
@@ -478,11 +3490,12 @@ def main():
 
         print(f"{Colors.OKGREEN}✅ ID Playlist: {playlist_id}{Colors.ENDC}")
 
-        # Estrai video
-        video_links = downloader.extract_playlist_videos(playlist_id)
-        if not video_links:
+        # Conta i video (l'elenco completo viene caricato in background durante il download)
+        video_count = downloader.get_playlist_size(playlist_id)
+        if not video_count:
             print(f"{Colors.FAIL}❌ Nessun video trovato nella playlist!{Colors.ENDC}")
             return
+        print(f"{Colors.OKGREEN}✅ Trovati {video_count} video!{Colors.ENDC}")
 
         # Cartella di download
         print(f"\n{Colors.OKBLUE}📁 Cartella di download predefinita:{Colors.ENDC}")
@@ -495,9 +3508,16 @@ def main():
         else:
             download_folder = input(f"{Colors.OKBLUE}Inserisci il percorso della cartella: {Colors.ENDC}").strip()
 
+        # Sincronizzazione incrementale se la cartella ha già un archivio
+        sync = False
+        if os.path.exists(os.path.join(download_folder, DownloadArchive.FILENAME)):
+            use_sync = input(f"{Colors.OKCYAN}Scaricare solo i video nuovi o falliti? (s/n): {Colors.ENDC}").strip().lower()
+            sync = use_sync in ['s', 'si', 'y', 'yes', '']
+
         # Conferma download
         print(
-            f"\n{Colors.WARNING}⚠️  Stai per scaricare {len(video_links)} file MP3 con metadati completi{Colors.ENDC}")
+            f"\n{Colors.WARNING}⚠️  Stai per scaricare {video_count} file "
+            f"{'MP3' if OUTPUT_FORMAT == 'mp3' else 'audio originali (m4a/opus)'} con metadati completi{Colors.ENDC}")
         print(f"{Colors.OKCYAN}📋 Include: titolo, artista, anno, copertina album{Colors.ENDC}")
         confirm = input(f"{Colors.OKCYAN}Continuare? (s/n): {Colors.ENDC}").strip().lower()
 
@@ -506,7 +3526,8 @@ def main():
             return
 
         # Avvia download
-        downloader.download_audio(video_links, download_folder)
+        downloader.download_audio(downloader.iter_playlist_videos(playlist_id), download_folder, sync=sync,
+                                  total=video_count, source=playlist_id)
 
     except KeyboardInterrupt:
         print(f"\n{Colors.WARNING}⚠️  Download interrotto dall'utente.{Colors.ENDC}")
@@ -514,5 +3535,103 @@ def main():
         print(f"\n{Colors.FAIL}❌ Errore inaspettato: {e}{Colors.ENDC}")
 
 
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Opzioni della modalità batch (senza interazione)"""
+    parser = argparse.ArgumentParser(
+        description="Scarica playlist YouTube con metadati completi, senza interazione (es. da cron). "
+                    "Senza argomenti parte la modalità interattiva.")
+    parser.add_argument('playlists', nargs='*', metavar='PLAYLIST', help="link o ID delle playlist")
+    parser.add_argument('-f', '--playlist-file', help="file con una playlist per riga (# per i commenti)")
+    parser.add_argument('-o', '--output', default=os.path.join(os.path.expanduser("~"), "Download", "Youtube MP3"),
+                        help="cartella di destinazione: ogni playlist ha una sottocartella con il suo titolo")
+    parser.add_argument('--api-key', default=os.environ.get('YOUTUBE_API_KEY'),
+                        help="API key della YouTube Data API (predefinita: $YOUTUBE_API_KEY)")
+    parser.add_argument('-w', '--workers', type=int, default=4, help="download contemporanei in tutto il batch")
+    parser.add_argument('-j', '--jobs', type=int, default=2, help="playlist elaborate contemporaneamente")
+    parser.add_argument('--bandwidth', help="banda massima totale in byte/s, es. 5M o 800K")
+    parser.add_argument('--sync', action='store_true', help="scarica solo i video nuovi o falliti")
+    parser.add_argument('--list', '--dry-run', dest='list', action='store_true',
+                        help="elenca i video di ogni playlist e quelli non ancora scaricati, senza scaricare nulla")
+    parser.add_argument('--format', choices=YouTubePlaylistDownloader.OUTPUT_FORMATS, default='mp3',
+                        help="mp3 (320 kbps) oppure native (m4a/opus originali, senza ricodifica)")
+    parser.add_argument('--stream', action='store_true', help="transcodifica in streaming, senza file intermedi")
+    parser.add_argument('--prefetch', type=int, default=2, help="video risolti in anticipo per playlist")
+    parser.add_argument('--retries', type=int, default=3,
+                        help="nuovi tentativi per video dopo errori di rete temporanei o throttling")
+    parser.add_argument('--region', help="codice paese (es. IT) per scartare i video bloccati in quella regione "
+                                         "(predefinito: nessun filtro)")
+    parser.add_argument('--recheck-unavailable', type=float, nargs='?', const=0.0, default=30.0, metavar='DAYS',
+                        help="con --sync riprova i video non disponibili registrati da più di DAYS giorni "
+                             "(predefinito 30; senza valore: tutti)")
+    parser.add_argument('--api-base-url', default=os.environ.get('YOUTUBE_API_BASE_URL'),
+                        help="server alternativo compatibile con la Data API (es. un server locale di test)")
+    parser.add_argument('--worker', action='store_true',
+                        help="modalità worker: più processi o macchine si dividono le playlist tramite una coda "
+                             "condivisa in --output (usato direttamente, senza sottocartelle)")
+    parser.add_argument('--worker-id', help="identificativo del worker (predefinito: host-pid)")
+    parser.add_argument('--lease', type=float, default=300.0,
+                        help="secondi dopo cui i video di un worker che non risponde tornano in coda")
+    parser.add_argument('--events', metavar='FILE',
+                        help="eventi strutturati in JSON lines: tempi di ogni stadio, byte, retry ed errori completi")
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help="metriche in formato Prometheus, aggiornate durante la run (es. per node_exporter)")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="espone le metriche Prometheus su http://127.0.0.1:PORT/metrics")
+    return parser.parse_args(argv)
+
+
+def cli(argv: Optional[List[str]] = None) -> int:
+    """Modalità batch: restituisce il codice di uscita (1 se qualche video non è riuscito)"""
+    args = parse_args(argv)
+
+    links = list(args.playlists)
+    if args.playlist_file:
+        try:
+            with open(args.playlist_file, encoding='utf-8') as f:
+                links += [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+        except OSError as e:
+            print(f"{Colors.FAIL}❌ Impossibile leggere {args.playlist_file}: {e}{Colors.ENDC}")
+            return 2
+    if not links:
+        print(f"{Colors.FAIL}❌ Nessuna playlist indicata (argomenti o --playlist-file){Colors.ENDC}")
+        return 2
+    if not args.api_key:
+        print(f"{Colors.FAIL}❌ API key mancante: usa --api-key o la variabile YOUTUBE_API_KEY{Colors.ENDC}")
+        return 2
+
+    bandwidth = None
+    if args.bandwidth:
+        from yt_dlp.utils import parse_bytes
+        bandwidth = parse_bytes(args.bandwidth)
+        if not bandwidth:
+            print(f"{Colors.FAIL}❌ Banda non valida: {args.bandwidth}{Colors.ENDC}")
+            return 2
+
+    downloader = YouTubePlaylistDownloader(args.api_key, max_workers=args.workers, prefetch=args.prefetch,
+                                           region=args.region, in_memory=True, output_format=args.format,
+                                           stream_transcode=args.stream, bandwidth=bandwidth,
+                                           api_base_url=args.api_base_url, events_file=args.events,
+                                           metrics_file=args.metrics_file, metrics_port=args.metrics_port,
+                                           max_retries=args.retries, recheck_unavailable=args.recheck_unavailable)
+    if args.list:
+        try:
+            PlaylistBatch(downloader, args.output).preview(links)
+        except KeyboardInterrupt:
+            return 130
+        return 0
+    if args.worker:
+        runner = QueueWorker(downloader, args.output, worker_id=args.worker_id, lease=args.lease)
+    else:
+        runner = PlaylistBatch(downloader, args.output, jobs=args.jobs, sync=args.sync)
+    try:
+        failures = runner.run(links)
+    except KeyboardInterrupt:
+        print(f"\n{Colors.WARNING}⚠️  Download interrotto dall'utente.{Colors.ENDC}")
+        return 130
+    return 1 if failures else 0
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli())
     main()
\ No newline at end of file